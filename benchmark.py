@@ -0,0 +1,252 @@
+"""
+benchmarks for pipe_rogue
+runs the game headless (see pipe_rogue.Game), no display or soundcard necessary
+
+usage:
+    python benchmark.py          # run all benchmarks
+    python benchmark.py fov      # run only the field of view benchmark
+    python benchmark.py effects  # run only the effect spawning benchmark
+    python benchmark.py lines    # run only the line cache benchmark
+    python benchmark.py levels   # run only the level file benchmark
+    python benchmark.py save     # run only the save / load benchmark
+    python benchmark.py generate # run only the level generator benchmark
+    python benchmark.py chunks   # run only the huge level (chunks) benchmark
+    python benchmark.py monsters # run only the monster scheduler benchmark
+"""
+
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+import pipe_rogue
+from pipe_rogue import Game
+
+
+def open_level(width=120, height=120, pillars=0.05, seed=1):
+    """returns a raw level (multi-line string, see pipe_rogue.legend):
+    one big room surrounded by walls, with randomly placed pillars (walls) inside
+
+    :param int width: number of tiles in x direction
+    :param int height: number of tiles in y direction
+    :param float pillars: chance (0...1) for each tile inside the room to become a pillar
+    :param seed: seed for the random generator, for reproducible levels
+    :return: str
+    """
+    rng = random.Random(seed)
+    lines = ["#" * width]
+    for y in range(1, height - 1):
+        line = "".join(
+            "#" if rng.random() < pillars else "." for x in range(1, width - 1)
+        )
+        lines.append("#" + line + "#")
+    lines.append("#" * width)
+    return "\n".join(lines)
+
+
+def headless_game_on(raw_level):
+    """creates a headless Game, appends raw_level as new dungeon level
+    and puts the player in the middle of it (on a floor tile)"""
+    g = Game(headless=True)
+    z = len(Game.dungeon)
+    g.create_dungeon2(raw_level, z)
+    level = Game.dungeon[z]
+    x, y = level.width // 2, level.height // 2
+    level.place(x, y, pipe_rogue.Floor())  # make sure the player does not stand inside a pillar
+    Game.player.z, Game.player.x, Game.player.y = z, x, y
+    return g
+
+
+def benchmark_fov(number=20):
+    """compares the field of view engines for several torch radii"""
+    print("---- field of view: 120 x 120 room with 5% pillars ----")
+    g = headless_game_on(open_level(120, 120))
+    old_radius, old_engine = Game.torch_radius, Game.fov_engine
+
+    def uncached_fov():
+        Game.fov_cache.clear()  # force a new calculation
+        Game.fov_applied.clear()
+        g.calculate_fov()
+
+    print(f"{'radius':>6} {'engine':>14} {'ms per fov':>10} {'visible':>8}")
+    for radius in (8, 12, 24, 48):
+        Game.torch_radius = radius
+        for engine in ("raycasting", "shadowcasting"):
+            Game.fov_engine = engine
+            seconds = timeit.timeit(uncached_fov, number=number)
+            visible = Game.dungeon[Game.player.z].fov.sum()
+            print(f"{radius:>6} {engine:>14} {seconds / number * 1000:>10.2f} {visible:>8}")
+    Game.torch_radius, Game.fov_engine = old_radius, old_engine
+
+
+def benchmark_effects(turns=50):
+    """spawns a big fireball (many short living Fire effects) every turn"""
+    print("---- effects: spawn and expire Fire effects every turn ----")
+    g = headless_game_on(open_level(120, 120, pillars=0))
+    px, py = Game.player.x, Game.player.y
+    print(f"{'per turn':>8} {'ms per turn':>11} {'gc runs':>7} {'pooled':>7}")
+    for number in (100, 1000, 5000):
+        collections_before = sum(s["collections"] for s in gc.get_stats())
+        start = time.perf_counter()  # not timeit: it switches off the garbage collector
+        for turn in range(turns):
+            for i in range(number):
+                pipe_rogue.Fire(px + i % 40 - 20, py + i // 40 % 40 - 20, max_age=1)
+            g.process_effects()
+        seconds = time.perf_counter() - start
+        collections = sum(s["collections"] for s in gc.get_stats()) - collections_before
+        pooled = len(pipe_rogue.Effect.pool.get(pipe_rogue.Fire, []))
+        print(f"{number:>8} {seconds / turns * 1000:>11.2f} {collections:>7} {pooled:>7}")
+    g.clear_effects()
+
+
+def benchmark_lines(number=20):
+    """compares calculate_line and the raycasting field of view
+    with an empty (cold) and a filled (warm) pipe_rogue.line_offsets cache"""
+    print("---- lines: cold versus warm line_offsets cache ----")
+    g = headless_game_on(open_level(120, 120))
+    px, py, z = Game.player.x, Game.player.y, Game.player.z
+    rng = random.Random(1)
+    targets = [(px + rng.randint(-20, 20), py + rng.randint(-20, 20)) for i in range(1000)]
+    old_radius, old_engine = Game.torch_radius, Game.fov_engine
+    Game.fov_engine = "raycasting"
+
+    def lines():
+        for target in targets:
+            pipe_rogue.calculate_line((px, py), target, z, "shoot")
+
+    def uncached_fov():
+        Game.fov_cache.clear()  # force a new calculation
+        Game.fov_applied.clear()
+        g.calculate_fov()
+
+    print(f"{'what':>22} {'ms cold':>8} {'ms warm':>8} {'speedup':>7}")
+    for name, function in (
+        ("1000 x calculate_line", lines),
+        ("fov radius 12", uncached_fov),
+        ("fov radius 48", uncached_fov),
+    ):
+        if name.startswith("fov"):
+            Game.torch_radius = int(name.split()[-1])
+        cold = 0.0
+        for i in range(number):
+            pipe_rogue.line_offsets.cache_clear()
+            cold += timeit.timeit(function, number=1)
+        warm = timeit.timeit(function, number=number)
+        print(f"{name:>22} {cold / number * 1000:>8.2f} {warm / number * 1000:>8.2f} {cold / warm:>7.1f}")
+    print("cache:", pipe_rogue.line_offsets.cache_info())
+    Game.torch_radius, Game.fov_engine = old_radius, old_engine
+
+
+def benchmark_levels(number=20):
+    """compares parsing a level text with compile_level and loading the
+    compiled level file (mmap) with read_level, for several level sizes"""
+    print("---- levels: compile text versus load compiled file ----")
+    print(f"{'size':>11} {'ms compile':>10} {'ms first read':>13} {'ms read':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in (100, 300, 1000):
+            raw_level = open_level(size, size)
+            filename = os.path.join(folder, f"level{size}.txt")
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(raw_level)
+            compiling = timeit.timeit(lambda: pipe_rogue.compile_level(raw_level), number=3) / 3
+            first = timeit.timeit(lambda: pipe_rogue.read_level(filename), number=1)  # writes .lvl
+            reading = timeit.timeit(lambda: pipe_rogue.read_level(filename), number=number) / number
+            print(f"{size:>5} x {size:<5} {compiling * 1000:>10.2f} {first * 1000:>13.2f} {reading * 1000:>8.2f}")
+
+
+def benchmark_save(turns=20):
+    """full and delta snapshots (pipe_rogue.SaveFile) while playing on a big level"""
+    print("---- save: full and delta snapshots, 200 x 200 room ----")
+    g = headless_game_on(open_level(200, 200))
+    Game.player.hp = 10 ** 9  # immortal
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as folder:
+        savefile = pipe_rogue.SaveFile(os.path.join(folder, "benchmark.sav"), full_every=turns)
+        print(f"{'snapshot':>8} {'ms save':>8} {'bytes':>8}")
+        for turn in range(turns + 1):
+            g.turn(*rng.choice(((0, -1), (1, 0), (0, 1), (-1, 0))))
+            pipe_rogue.Fire(Game.player.x + 1, Game.player.y, max_age=3)
+            start = time.perf_counter()
+            size = savefile.save()
+            seconds = time.perf_counter() - start
+            if turn in (0, 1, turns // 2, turns):
+                print(f"{'full' if turn == 0 else 'delta':>8} {seconds * 1000:>8.2f} {size:>8}")
+        start = time.perf_counter()
+        savefile.load(g)
+        print(f"load full + {turns} deltas: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+def benchmark_generate(number=5):
+    """generation time of pipe_rogue.generate_level for each style and several level sizes"""
+    print("---- generate: procedural levels (pipe_rogue.generate_level) ----")
+    print(f"{'size':>11} {'style':>6} {'ms generate':>11} {'floor':>6} {'spawns':>7}")
+    for size in (100, 200, 500, 1000, 2000):
+        repeat = number if size <= 500 else 1
+        for style in ("rooms", "bsp", "caves"):
+            seconds = timeit.timeit(
+                lambda: pipe_rogue.generate_level(style, size, size, seed=1), number=repeat
+            )
+            kind, spawns = pipe_rogue.generate_level(style, size, size, seed=1)
+            floor = (kind == pipe_rogue.Floor.code).mean()
+            print(f"{size:>5} x {size:<5} {style:>6} {seconds / repeat * 1000:>11.2f} {floor:>6.2f} {len(spawns):>7}")
+
+
+def benchmark_chunks(turns=100):
+    """plays on generated caves up to 4096 x 4096 tiles: time per turn and memory of the level
+    (numpy arrays plus the chunks of Structure objects, see pipe_rogue.Level.chunk)"""
+    print("---- chunks: random walk on huge generated caves ----")
+    print(f"{'size':>11} {'s create':>8} {'ms per turn':>11} {'chunks':>6} {'MB arrays':>9} {'monsters':>8}")
+    for size in (256, 1024, 4096):
+        start = time.perf_counter()
+        g = Game(headless=True, levels=[dict(style="caves", width=size, height=size, seed=1, player=True)])
+        creating = time.perf_counter() - start
+        Game.player.hp = 10 ** 9  # immortal
+        rng = random.Random(1)
+        start = time.perf_counter()
+        for turn in range(turns):
+            g.turn(*rng.choice(((0, -1), (1, 0), (0, 1), (-1, 0))))
+        seconds = time.perf_counter() - start
+        level = Game.dungeon[Game.player.z]
+        arrays = sum(a.nbytes for a in vars(level).values() if hasattr(a, "nbytes"))
+        print(
+            f"{size:>5} x {size:<5} {creating:>8.2f} {seconds / turns * 1000:>11.2f} "
+            f"{len(level.chunks):>6} {arrays / 2 ** 20:>9.1f} {len(Game.zoo):>8}"
+        )
+
+
+def benchmark_monsters(turns=100):
+    """time per turn for more and more monsters on a 1024 x 1024 cave: only the monsters
+    near the player act (see pipe_rogue.Game.due_monsters), all others stay dormant"""
+    print("---- monsters: scheduler on a 1024 x 1024 cave ----")
+    print(f"{'monsters':>8} {'ms per turn':>11} {'awake':>6}")
+    for density in (0.001, 0.01, 0.05):
+        source = dict(style="caves", width=1024, height=1024, seed=1, player=True, monsters=density)
+        g = Game(headless=True, levels=[source])
+        Game.player.hp = 10 ** 9  # immortal
+        rng = random.Random(1)
+        start = time.perf_counter()
+        for turn in range(turns):
+            g.turn(*rng.choice(((0, -1), (1, 0), (0, 1), (-1, 0))))
+        seconds = time.perf_counter() - start
+        awake = sum(1 for m in Game.zoo.values() if m.due is not None and not m.dormant)
+        print(f"{len(Game.zoo):>8} {seconds / turns * 1000:>11.2f} {awake:>6}")
+
+
+benchmarks = {
+    "fov": benchmark_fov,
+    "effects": benchmark_effects,
+    "lines": benchmark_lines,
+    "levels": benchmark_levels,
+    "save": benchmark_save,
+    "generate": benchmark_generate,
+    "chunks": benchmark_chunks,
+    "monsters": benchmark_monsters,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        benchmarks[name]()
@@ -47,15 +47,11 @@ unicode tables:
 # TODO: monster update should call monster_ai
 # TODO: GUI buttons for commands
 # TODO: GUI yes-no box
-# TODO: save and load game to/from disk
-# TODO: PgUp/PgDown should scroll log text
 # TODO: help text of all keyboard commands
 # TODO: Flames / Water becoming smaller and smaller before disappearing
 # TODO: progress bar for terminal download
 # TODO: learn LayerdDirty Spritegroups, update all sprites to DirtySprites -> make dirty and visible work correctly
 # TODO: game menu, death of player -> newstart
-# TODO: include pathfinding from test for Monster hunting
-# TODO: save levels to pickle, load levels when changing player.z
 # TODO: dungeon generator, dungeon Viewer / Editor (pysimplegui?)
 # TODO: include complex fight / strike system
 # TODO: diplay unicode symbols for attack/defense rolls
@@ -67,6 +63,10 @@ unicode tables:
 # TODO: animations of blocks / monsters when nothing happens -> animcycle
 # TODO: non-player light source / additive lightmap
 # TODO: drop items -> autoloot? manual pickup command?
+# done: save and load game to/from disk (F5 / F9)
+# done: save levels to pickle, load levels when changing player.z
+# done: include pathfinding from test for Monster hunting
+# done: PgUp/PgDown should scroll log text
 # done: Flytext ignoriert picture parameter
 # done: better code for FireDragon ( hunt/flee ), keep distance, reload...
 # done: shield: should protect from effect damange,
@@ -109,9 +109,17 @@ unicode tables:
 
 import pygame
 import pygame.freetype  # not automatically loaded when importing pygame!
+import numpy as np
+import functools
+import heapq
 import random
 import os
+import hashlib
+import mmap
+import pickle
+import struct
 import sys
+import time
 
 version = 0.1
 
@@ -630,31 +638,718 @@ class Button:
         pass
 
 
+class SpatialIndex:
+    """occupancy index for Monsters, Items and Effects.
+    maps a tile key like (z, x, y) to the objects standing on that tile,
+    so that "what is at this tile?" is a dictionary lookup instead of a scan over
+    Game.zoo, Game.items or Game.effects.
+    The objects must have a unique .number attribute and must update the index themselves
+    when they spawn, move or die (see Monster._relocate, Item._relocate, Effect.next_turn)"""
+
+    def __init__(self):
+        self.cells = {}  # {key: {number: object}}
+
+    def add(self, key, thing):
+        self.cells.setdefault(key, {})[thing.number] = thing
+
+    def remove(self, key, thing):
+        cell = self.cells.get(key)
+        if cell is None:
+            return
+        cell.pop(thing.number, None)
+        if not cell:
+            del self.cells[key]  # do not keep empty tiles in memory
+
+    def move(self, old_key, new_key, thing):
+        if old_key == new_key:
+            return
+        self.remove(old_key, thing)
+        self.add(new_key, thing)
+
+    def at(self, key):
+        """returns a list (safe to modify while iterating) of all objects at key"""
+        cell = self.cells.get(key)
+        if cell is None:
+            return []
+        return list(cell.values())
+
+    def clear(self):
+        self.cells = {}
+
+
+class SurfaceCache:
+    """least recently used cache for rendered pygame Surfaces (glyphs, text).
+    The memory of all cached Surfaces (pixel data) is limited to max_bytes,
+    the least recently used Surfaces are dropped first.
+    hits, misses and evictions are counted for profiling, see stats"""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.surfaces = {}  # {key: Surface}, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def bytes_of(surf):
+        return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+    def get(self, key):
+        """returns the cached Surface for key or None"""
+        surf = self.surfaces.pop(key, None)
+        if surf is None:
+            self.misses += 1
+            return None
+        self.surfaces[key] = surf  # re-insert -> most recently used is last in dict
+        self.hits += 1
+        return surf
+
+    def put(self, key, surf):
+        """store surf and drop the least recently used Surfaces if over max_bytes"""
+        old = self.surfaces.pop(key, None)
+        if old is not None:
+            self.bytes -= self.bytes_of(old)
+        self.surfaces[key] = surf
+        self.bytes += self.bytes_of(surf)
+        while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+            oldest = next(iter(self.surfaces))
+            self.bytes -= self.bytes_of(self.surfaces.pop(oldest))
+            self.evictions += 1
+
+    def clear(self):
+        self.surfaces = {}
+        self.bytes = 0
+
+    def stats(self):
+        """returns a dict with hits, misses, evictions, number of entries and bytes"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.surfaces),
+            "bytes": self.bytes,
+        }
+
+
+class FontRegistry:
+    """loads each font only once: one font object for each (file, size, backend).
+    backend "font": pygame.font.Font(file, size), the size is fixed when loading.
+    backend "freetype": pygame.freetype.Font(file), the size is given when rendering,
+    so all sizes share one font object (size is ignored).
+    file None is the default font of pygame.
+    The memory of a font object is estimated by the size of its font file, see stats"""
+
+    backends = ("font", "freetype")
+
+    def __init__(self):
+        self.fonts = {}  # {(file, size, backend): font object}
+        self.file_bytes = {}  # {file: size of the font file in bytes}
+
+    def get(self, file=None, size=None, backend="freetype"):
+        """returns the font object for file, size and backend, loads it on first use"""
+        if backend == "freetype":
+            size = None
+        key = (file, size, backend)
+        font = self.fonts.get(key)
+        if font is None:
+            if backend == "font":
+                font = pygame.font.Font(file, size)
+            elif backend == "freetype":
+                font = pygame.freetype.Font(file)
+            else:
+                raise ValueError(f"backend must be one of {FontRegistry.backends}, not {backend!r}")
+            self.fonts[key] = font
+            if file is not None and file not in self.file_bytes:
+                self.file_bytes[file] = os.path.getsize(file)
+        return font
+
+    def clear(self):
+        self.fonts = {}
+
+    def stats(self):
+        """returns a dict with the number of loaded font objects and their estimated bytes"""
+        return {
+            "fonts": len(self.fonts),
+            "bytes": sum(self.file_bytes.get(file, 0) for file, size, backend in self.fonts),
+        }
+
+
+class MessageLog:
+    """bounded message log: a ring buffer for the last capacity messages.
+    Messages are numbered from 1 for the whole session, get(number) is O(1).
+    When the buffer is full, the oldest message is overwritten. If spill_file is set,
+    overwritten messages are appended to that text file instead of being lost"""
+
+    def __init__(self, capacity=1000, spill_file=None):
+        self.capacity = capacity
+        self.lines = [None] * capacity
+        self.count = 0  # number of messages since start, number of newest message
+        self.spill_file = spill_file
+        self.spill = None  # file object, opened when the first message is overwritten
+
+    def append(self, text):
+        slot = self.count % self.capacity
+        if self.count >= self.capacity and self.spill_file is not None:
+            if self.spill is None:
+                self.spill = open(self.spill_file, "a", encoding="utf-8")
+            self.spill.write(f"{self.count - self.capacity + 1}: {self.lines[slot]}\n")
+        self.lines[slot] = text
+        self.count += 1
+
+    def extend(self, texts):
+        for text in texts:
+            self.append(text)
+
+    def oldest(self):
+        """number of the oldest message still in memory"""
+        return max(1, self.count - self.capacity + 1)
+
+    def get(self, number):
+        """returns message number (1...count) or None if overwritten / not yet written"""
+        if number < self.oldest() or number > self.count:
+            return None
+        return self.lines[(number - 1) % self.capacity]
+
+    def __len__(self):
+        return self.count - self.oldest() + 1 if self.count else 0
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+
+class LevelRow:
+    """one line of a Level: LevelRow[x] returns the Structure at x,y like a list,
+    the Structure objects are created chunk by chunk on first access, see Level.chunk"""
+
+    __slots__ = ("level", "y")
+
+    def __init__(self, level, y):
+        self.level = level
+        self.y = y
+
+    def __len__(self):
+        return self.level.width
+
+    def position(self, x):
+        """returns (chunk, x, y inside the chunk) of tile x, raises IndexError outside of the level"""
+        width = self.level.width
+        if x < 0:
+            x += width  # negative index counts from the end, like a list
+        if not 0 <= x < width:
+            raise IndexError("x outside of level")
+        size = Level.chunk_size
+        return self.level.chunk(x // size, self.y // size), x % size, self.y % size
+
+    def __getitem__(self, x):
+        lines, cx, cy = self.position(x)
+        return lines[cy][cx]
+
+    def __setitem__(self, x, tile):
+        lines, cx, cy = self.position(x)
+        lines[cy][cx] = tile
+
+    def __iter__(self):
+        for x in range(self.level.width):
+            yield self[x]
+
+
+class Level(list):
+    """one dungeon level: a list of lines (LevelRow), so that Game.dungeon[z][y][x] returns the Structure at x,y.
+    All tile properties are stored in numpy arrays [y, x], the Structure objects are
+    only thin views into those arrays (see Structure.fov, Structure.explored, Structure.bgcolor):
+
+    kind ............ tile type code (index of the Structure subclass in Level.kinds)
+    block_sight ..... bool mask
+    block_movement .. bool mask
+    block_shooting .. bool mask
+    explored ........ bool mask, tile was seen by the player
+    fov ............. bool mask, tile is currently in field of view of the player
+    light ........... uint8 grey value (background color) for tiles in field of view
+    burning ......... bool mask, oil is burning (see Oil.burning and Game.spread_fire)
+
+    The Structure objects are created in chunks of chunk_size x chunk_size tiles when a tile of
+    the chunk is accessed for the first time (see chunk), so a huge level only costs the arrays
+    (some bytes per tile) plus the chunks around the player. Chunks far away from the player are
+    forgotten again (see evict_chunks), the state of their doors and terminals is kept in .states.
+    Field of view, lines and distance maps only use the arrays and never see any chunk.
+
+    Tiles that change their type (kind) or explored state are recorded in .changed as (ys, xs)
+    index arrays, so that the radar can update only those tiles, see mark_changed and Viewer.make_radar
+    """
+
+    kinds = []  # all Structure subclasses, index is the tile type code. filled by Structure.__init_subclass__
+    prototypes = []  # one new Structure object for each tile type code, see prototype
+    changed_limit = 256  # max. number of entries in .changed, above that all_changed is set instead
+    chunk_size = 64  # tiles in x and y direction of each chunk of Structure objects
+    chunk_limit = 64  # max. number of chunks of Structure objects per level, see evict_chunks
+
+    def __init__(self, kind):
+        """:param kind: numpy array [y, x] of tile codes, see compile_level"""
+        self.height, self.width = kind.shape
+        super().__init__(LevelRow(self, y) for y in range(self.height))
+        shape = (self.height, self.width)
+        self.kind = np.array(kind, dtype=np.uint8)  # a copy: kind may be a read-only mmap
+        # the block masks of a new Structure object of each tile type (a new Door is closed)
+        for name in ("block_sight", "block_movement", "block_shooting"):
+            table = np.array([getattr(Level.prototype(code), name) for code in range(len(Level.kinds))])
+            setattr(self, name, table.astype(bool)[self.kind])
+        self.explored = np.zeros(shape, dtype=bool)
+        self.fov = np.zeros(shape, dtype=bool)
+        self.light = np.zeros(shape, dtype=np.uint8)
+        self.burning = np.zeros(shape, dtype=bool)
+        self.chunks = {}  # {(cx, cy): list of lines of Structure objects}, see chunk
+        self.states = {}  # {(x, y): state} for tiles of chunks that do not exist (yet), see structure_states
+        self.fire_front = []  # [(ys, xs)] tiles that started burning since the last Game.spread_fire
+        self.changed = []  # [(ys, xs)] tiles with new kind or explored state, see mark_changed
+        self.movement_version = 0  # increased whenever a tile changes block_movement, see Game.distance_map
+        self.all_changed = True  # everything is new
+
+    @staticmethod
+    def prototype(code):
+        """returns a new Structure object of tile type code, shared by all levels: do not change it"""
+        if len(Level.prototypes) != len(Level.kinds):
+            Level.prototypes = [k() for k in Level.kinds]
+        return Level.prototypes[code]
+
+    def chunk(self, cx, cy):
+        """returns the Structure objects of chunk cx, cy (a list of lines), created on first access:
+        one Structure object for each tile code, with the state from .states and its pictures"""
+        lines = self.chunks.get((cx, cy))
+        if lines is not None:
+            return lines
+        size = Level.chunk_size
+        left, top = cx * size, cy * size
+        lines = [
+            [Level.kinds[code]() for code in row]
+            for row in self.kind[top : top + size, left : left + size].tolist()
+        ]
+        self.chunks[(cx, cy)] = lines
+        # tile codes of the chunk with a margin of one tile, 255 outside of the level
+        codes = np.full((len(lines) + 2, len(lines[0]) + 2), 255, dtype=np.uint8)
+        y1, x1 = max(top - 1, 0), max(left - 1, 0)
+        margin = self.kind[y1 : top + size + 1, x1 : left + size + 1]
+        codes[y1 - top + 1 : y1 - top + 1 + margin.shape[0], x1 - left + 1 : x1 - left + 1 + margin.shape[1]] = margin
+        codes = codes.tolist()
+        Level.prototype(0)
+        neighbor = Level.prototypes + [None] * (256 - len(Level.prototypes))
+        for j, line in enumerate(lines):
+            north, here, south = codes[j], codes[j + 1], codes[j + 2]
+            for i, tile in enumerate(line):
+                tile.level, tile.x, tile.y = self, left + i, top + j
+                state = self.states.pop((tile.x, tile.y), None)
+                if state is not None:
+                    vars(tile).update(state)
+                tile.create_pictures(
+                    [neighbor[north[i + 1]], neighbor[here[i + 2]], neighbor[south[i + 1]], neighbor[here[i]]]
+                )
+        return lines
+
+    def neighbors(self, x, y):
+        """returns the 4 neighbors (north, east, south, west) of tile x,y for create_pictures,
+        None outside of the level. The neighbors are prototypes: no other chunk is created"""
+        neighbors = []
+        for dx, dy in ((0, -1), (1, 0), (0, 1), (-1, 0)):
+            if 0 <= x + dx < self.width and 0 <= y + dy < self.height:
+                neighbors.append(Level.prototype(self.kind[y + dy, x + dx]))
+            else:
+                neighbors.append(None)
+        return neighbors
+
+    def evict_chunks(self, x, y):
+        """forget the Structure objects of the chunks farthest away from tile x,y
+        until only Level.chunk_limit chunks are left. Their state goes into .states"""
+        if len(self.chunks) <= Level.chunk_limit:
+            return
+        size = Level.chunk_size
+        cx, cy = x // size, y // size
+        farthest = sorted(self.chunks, key=lambda c: max(abs(c[0] - cx), abs(c[1] - cy)), reverse=True)
+        for key in farthest[: len(self.chunks) - Level.chunk_limit]:
+            self.states.update(self.chunk_states(*key))
+            del self.chunks[key]
+
+    def mark_changed(self, ys, xs):
+        """record that the tiles at the index arrays (or ints) ys, xs changed their kind or explored state.
+        The consumer (Viewer.make_radar) empties .changed and resets .all_changed"""
+        if self.all_changed:
+            return
+        if len(self.changed) >= Level.changed_limit:
+            self.changed = []
+            self.all_changed = True
+            return
+        self.changed.append((ys, xs))
+
+    def bind(self, x, y, tile):
+        """make tile a view into the arrays at position x,y and copy its properties into the arrays"""
+        tile.level, tile.x, tile.y = self, x, y
+        if self.kind[y, x] != tile.code:
+            self.kind[y, x] = tile.code
+            self.mark_changed(y, x)
+        self.block_sight[y, x] = tile.block_sight
+        if self.block_movement[y, x] != tile.block_movement:
+            self.block_movement[y, x] = tile.block_movement
+            self.movement_version += 1
+        self.block_shooting[y, x] = tile.block_shooting
+
+    def place(self, x, y, tile):
+        """replace the tile at x,y with a new Structure object"""
+        self[y][x] = tile
+        self.bind(x, y, tile)
+        Game.opacity_changed()
+
+    @staticmethod
+    def type_table(attribute, dtype=np.uint8):
+        """numpy array with the value of a class attribute for each tile type code.
+        Index it with Level.kind to get the attribute for each tile of a level at once"""
+        return np.array([getattr(k, attribute) for k in Level.kinds], dtype=dtype)
+
+    def ignite(self, ys, xs):
+        """set the oil at the index arrays (or ints) ys, xs on fire"""
+        self.burning[ys, xs] = True
+        self.fire_front.append((ys, xs))
+
+    def chunk_states(self, cx, cy):
+        """returns {(x, y): {attribute: value}} for the tiles of chunk cx, cy with state attributes"""
+        stateful = np.array([bool(k.state_attributes) for k in Level.kinds])
+        size = Level.chunk_size
+        left, top = cx * size, cy * size
+        lines = self.chunks[(cx, cy)]
+        states = {}
+        for y, x in np.argwhere(stateful[self.kind[top : top + size, left : left + size]]).tolist():
+            tile = lines[y][x]
+            attributes = vars(tile)
+            states[(left + x, top + y)] = {
+                a: attributes[a] for a in tile.state_attributes if a in attributes
+            }
+        return states
+
+    def structure_states(self):
+        """returns {(x, y): {attribute: value}} for all tiles with state attributes
+        (see Structure.state_attributes), like open or closed doors.
+        Tiles of chunks that were never created have no state"""
+        states = dict(self.states)
+        for cx, cy in self.chunks:
+            states.update(self.chunk_states(cx, cy))
+        return states
+
+    def restore_states(self, states):
+        """give the tiles at (x, y) their state from structure_states, also into the block masks.
+        Tiles of chunks that do not exist get their state when the chunk is created"""
+        for (x, y), state in states.items():
+            for name in ("block_sight", "block_movement", "block_shooting"):
+                if name in state:
+                    getattr(self, name)[y, x] = state[name]
+            if (x // Level.chunk_size, y // Level.chunk_size) in self.chunks:
+                tile = self[y][x]
+                vars(tile).update(state)
+                tile.create_pictures(self.neighbors(x, y))
+            else:
+                self.states[(x, y)] = state
+
+    def cells_of(self, structure_class):
+        """returns a list of all (x,y) tiles of exactly this Structure class"""
+        return [
+            (int(x), int(y)) for y, x in np.argwhere(self.kind == structure_class.code)
+        ]
+
+
+class SaveFile:
+    """saves the whole game state (the class attributes of Game) into one file and loads it again.
+    The first save writes a full snapshot. Every later save appends a delta snapshot with only the
+    entities (pickled monsters, items and effects) and tile flags that changed since the last save or load.
+    After full_every delta snapshots, the next save writes a new full snapshot.
+    Tile flags (explored, fov, burning) are stored as packed bitsets, see np.packbits.
+    Tile codes and light are stored as bytes
+
+    file format: header (magic, format version), then records: kind (b"F" full, b"D" delta),
+    length, pickled snapshot. Loading reads the last full snapshot and applies all following deltas
+    """
+
+    magic = b"PRSV"
+    version = 1
+    header = struct.Struct("<4sH")
+    record = struct.Struct("<cI")
+    flags = ("explored", "fov", "burning")  # bool masks of Level, stored as packed bits
+
+    def __init__(self, filename, full_every=50):
+        self.filename = filename
+        self.full_every = full_every
+        self.last = None  # snapshot of the last save or load, see capture
+        self.deltas = 0  # number of delta snapshots since the last full snapshot
+
+    @staticmethod
+    def capture():
+        """returns a snapshot (dict) of the whole game state"""
+        levels = {}
+        for z, level in enumerate(Game.dungeon):
+            if level is None:
+                levels[z] = None  # not materialized or compacted, see Game.enter_level
+                continue
+            tiles = {
+                "shape": level.kind.shape,
+                "kind": level.kind.ravel().copy(),
+                "light": level.light.ravel().copy(),
+            }
+            for name in SaveFile.flags:
+                tiles[name] = np.packbits(getattr(level, name))
+            tiles["states"] = level.structure_states()
+            tiles["fire_front"] = list(level.fire_front)
+            levels[z] = tiles
+        entities = {}
+        for group, container in (("monster", Game.zoo), ("item", Game.items), ("effect", Game.effects)):
+            for number, entity in container.items():
+                entities[(group, number)] = pickle.dumps(entity, pickle.HIGHEST_PROTOCOL)
+        game = {
+            "turn_number": Game.turn_number,
+            "monsternumber": Game.monsternumber,
+            "itemnumber": Game.itemnumber,
+            "effectnumber": Game.effectnumber,
+            "buffnumber": Buff.number,
+            "torch_radius": Game.torch_radius,
+            "running": Game.running,
+            "player": Game.player.number,
+            "level_sources": list(Game.level_sources),
+            "level_visits": list(Game.level_visits),
+            "schedule": list(Game.schedule),
+            "random": random.getstate(),
+        }
+        return {
+            "game": game,
+            "levels": levels,
+            "compacted": dict(Game.compacted),
+            "entities": entities,
+        }
+
+    @staticmethod
+    def difference(old, new):
+        """returns a delta snapshot: everything in snapshot new that is different from snapshot old.
+        Levels are None (not materialized), ("tiles", tiles) for a new level or
+        ("changes", {name: (indices, values)}) for the changed parts of a flag array"""
+        levels = {}
+        for z, tiles in new["levels"].items():
+            before = old["levels"].get(z)
+            if tiles is None:
+                if before is not None or z not in old["levels"]:
+                    levels[z] = None
+                continue
+            if before is None or before["shape"] != tiles["shape"]:
+                levels[z] = ("tiles", tiles)
+                continue
+            changes = {}
+            for name in ("kind", "light") + SaveFile.flags:
+                where = np.flatnonzero(tiles[name] != before[name])
+                if where.size:
+                    changes[name] = (where.astype(np.int32), tiles[name][where])
+            states = {
+                position: state
+                for position, state in tiles["states"].items()
+                if before["states"].get(position) != state
+            }
+            states.update((p, None) for p in before["states"] if p not in tiles["states"])
+            if states:
+                changes["states"] = states
+            if tiles["fire_front"] or before["fire_front"]:
+                changes["fire_front"] = tiles["fire_front"]
+            if changes:
+                levels[z] = ("changes", changes)
+        return {
+            "game": {k: v for k, v in new["game"].items() if old["game"].get(k) != v},
+            "levels": levels,
+            "compacted": {
+                z: c for z, c in new["compacted"].items() if old["compacted"].get(z) is not c
+            },
+            "uncompacted": [z for z in old["compacted"] if z not in new["compacted"]],
+            "entities": {
+                key: data for key, data in new["entities"].items() if old["entities"].get(key) != data
+            },
+            "removed": [key for key in old["entities"] if key not in new["entities"]],
+        }
+
+    @staticmethod
+    def apply(snapshot, delta):
+        """change snapshot (in place) by a delta snapshot, see difference"""
+        snapshot["game"].update(delta["game"])
+        for z, change in delta["levels"].items():
+            if change is None:
+                snapshot["levels"][z] = None
+            elif change[0] == "tiles":
+                snapshot["levels"][z] = change[1]
+            else:
+                tiles = snapshot["levels"][z]
+                for name, value in change[1].items():
+                    if name == "states":
+                        for position, state in value.items():
+                            if state is None:
+                                tiles["states"].pop(position, None)
+                            else:
+                                tiles["states"][position] = state
+                    elif name == "fire_front":
+                        tiles["fire_front"] = value
+                    else:
+                        where, values = value
+                        tiles[name][where] = values
+        snapshot["compacted"].update(delta["compacted"])
+        for z in delta["uncompacted"]:
+            del snapshot["compacted"][z]
+        snapshot["entities"].update(delta["entities"])
+        for key in delta["removed"]:
+            del snapshot["entities"][key]
+
+    @staticmethod
+    def restore(game, snapshot):
+        """replace the whole game state by snapshot. game: the Game instance"""
+        Game.reset()
+        g = snapshot["game"]
+        for name in ("turn_number", "monsternumber", "itemnumber", "effectnumber", "torch_radius", "running"):
+            setattr(Game, name, g[name])
+        Buff.number = g["buffnumber"]
+        Game.level_sources = list(g["level_sources"])
+        Game.level_visits = list(g["level_visits"])
+        Game.schedule = list(g["schedule"])  # still a heap
+        random.setstate(g["random"])
+        Game.compacted = dict(snapshot["compacted"])
+        Game.dungeon = [None for z in snapshot["levels"]]
+        for z, tiles in snapshot["levels"].items():
+            if tiles is None:
+                continue
+            height, width = tiles["shape"]
+            level = game.rebuild_level(tiles["kind"].reshape(height, width), tiles["states"], z)
+            for name in SaveFile.flags:
+                bits = np.unpackbits(tiles[name], count=height * width)
+                getattr(level, name)[:] = bits.reshape(height, width).astype(bool)
+            level.light[:] = tiles["light"].reshape(height, width)
+            level.fire_front = list(tiles["fire_front"])
+        for data in snapshot["entities"].values():
+            Game.adopt(pickle.loads(data))
+        Game.player = Game.zoo[g["player"]]
+
+    def save(self):
+        """write a full snapshot (first save or after full_every deltas) or append a delta snapshot.
+        returns the number of bytes of the snapshot"""
+        snapshot = SaveFile.capture()
+        if self.last is None or self.deltas >= self.full_every or not os.path.exists(self.filename):
+            data = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+            with open(self.filename + ".tmp", "wb") as f:
+                f.write(SaveFile.header.pack(SaveFile.magic, SaveFile.version))
+                f.write(SaveFile.record.pack(b"F", len(data)))
+                f.write(data)
+            os.replace(self.filename + ".tmp", self.filename)
+            self.deltas = 0
+        else:
+            data = pickle.dumps(SaveFile.difference(self.last, snapshot), pickle.HIGHEST_PROTOCOL)
+            with open(self.filename, "ab") as f:
+                f.write(SaveFile.record.pack(b"D", len(data)))
+                f.write(data)
+            self.deltas += 1
+        self.last = snapshot
+        return len(data)
+
+    def load(self, game):
+        """rebuild the game state from the save file. game: the Game instance"""
+        with open(self.filename, "rb") as f:
+            data = f.read()
+        magic, version = SaveFile.header.unpack_from(data)
+        if magic != SaveFile.magic:
+            raise ValueError(f"{self.filename} is not a save file")
+        if version != SaveFile.version:
+            raise ValueError(f"save file version {version} is not supported, expected {SaveFile.version}")
+        offset = SaveFile.header.size
+        snapshot = None
+        while offset < len(data):
+            kind, length = SaveFile.record.unpack_from(data, offset)
+            offset += SaveFile.record.size
+            part = pickle.loads(data[offset : offset + length])
+            offset += length
+            if kind == b"F":
+                snapshot = part
+                self.deltas = 0
+            else:
+                SaveFile.apply(snapshot, part)
+                self.deltas += 1
+        SaveFile.restore(game, snapshot)
+        self.last = SaveFile.capture()
+
+
 class Game:
     player = None
     torch_radius = 12
-    dungeon = []
+    fov_engine = "shadowcasting"  # "shadowcasting" or "raycasting", see calculate_fov
+    opacity_version = 0  # increased whenever a tile changes block_sight, see opacity_changed
+    fov_cache = {}  # {z: {(x, y, torch_radius, opacity_version, fov_engine): (ys, xs)}}
+    fov_cache_size = 64  # max. number of cached fov results per level
+    fov_applied = {}  # {z: (key, visible)} the fov result currently written into the tiles of level z
+    path_radius = 40  # distance maps reach this many steps from the player, see distance_map
+    simulation_chunks = 1  # buffs of monsters are updated only this many chunks (see Level.chunk_size) around the player
+    activation_radius = 24  # unseen monsters farther away from the player go dormant, see due_monsters
+    dormant_turns = 50  # timer of a dormant monster: after so many turns it acts once, or only wanders if far away
+    awake_turns = 20  # a monster woken up by a noise or the player stays awake at least so many turns
+    action_energy = 100  # energy for one action of a monster, each monster gains its .speed every turn
+    schedule = []  # heap of (turn, monster number): when each monster acts next or wakes up, see due_monsters
+    active_chunks = set()  # keys (z, cx, cy) of the simulated chunks of the last turn, see activate_chunks
+    distance_maps = {}  # {z: (key, (distances, left, top))} the last distance map of each level
+    light_applied = {}  # {z: (key, box)} light sources and bounding box currently written into Level.light
+    light_kernels = {}  # {(radius, center, mingrey, maxgrey): numpy array}, see light_kernel
+    dungeon = []  # one Level for each z, None if the level is not materialized, see enter_level
+    level_sources = []  # raw level, level file name or generate_level arguments for each z
+    level_limit = 2  # max. number of materialized levels, including the current level, see evict_levels
+    level_visits = []  # z of the materialized levels, least recently entered first
+    compacted = {}  # {z: dict} levels the player has left, see compact_level
     # hold global variables
     zoo = {}  # container for all monsters, including the player
+    casualties = []  # monsters (and the player) whose hp dropped to 0 or below, removed at the end of Game.turn
     monsternumber = 0  # counter for all monsters
     items = {}
     itemnumber = 0
     turn_number = 0
     effectnumber = 0
     running = True
+    headless = False  # if True, the game runs without Viewer: no display, no fonts, no mixer
+    keep_events = False  # if headless: keep presentation events in Game.events instead of dropping them
+    events = []  # queue of presentation side effects (func, args, kwargs), consumed by the Viewer
     max_tiles_x = 0  # max. dimension of an auto-generated dungeon level
     max_tiles_y = 0  # max. dimension of an auto-generated dungeon level
     effects = {}  # effects for this dungeon level
+    new_fires = {}  # {effect number: Fire} created since the last Game.spread_fire, see Fire.__init__
+    zoo_index = SpatialIndex()  # {(z, x, y): {number: monster}}
+    zoo_chunks = SpatialIndex()  # {(z, cx, cy): {number: monster}} for each chunk, see Level.chunk_size
+    item_index = SpatialIndex()  # {(z, x, y): {number: item}}, only items not in backpack
+    effect_index = SpatialIndex()  # {(x, y): {number: effect}}, only for current level
     # lookup1: dx, dy -> index, start with north, then clockwise
     lookup_nesw = {(-1, 0): 0, (0, 1): 1, (1, 0): 2, (0, -1): 3}
-
-    def __init__(self):
+    # multipliers xx, xy, yx, yy to transform the coordinates of the first octant into all 8 octants
+    octants = (
+        (1, 0, 0, 1),
+        (0, 1, 1, 0),
+        (0, -1, 1, 0),
+        (-1, 0, 0, 1),
+        (-1, 0, 0, -1),
+        (0, -1, -1, 0),
+        (0, 1, -1, 0),
+        (1, 0, 0, -1),
+    )
+    # dx, dy of the 8 neighbors of a tile (numpy arrays, for vectorized neighbor lookups)
+    neighbors_dx = np.array((0, 1, 1, 1, 0, -1, -1, -1))
+    neighbors_dy = np.array((-1, -1, 0, 1, 1, 1, 0, -1))
+
+    def __init__(self, headless=False, levels=None):
+        """create all dungeon levels. if headless is True, no picture is created,
+        and no pygame display, font or mixer is necessary (for simulation, balancing, testing)
+        levels: list of raw levels (multi-line strings), file names of level files (ending with .txt,
+        see read_level) or dicts with the arguments of generate_level.
+        The first level must contain the player "@". Default: level1, level2, level3"""
+        Game.reset()
+        Game.headless = headless
         # self.create_dungeon([level1, level2, level3])
-        for z, level in enumerate([level1, level2, level3]):
-            self.create_dungeon2(level, z)
-
-        # extra food on2,4
-        Food(2, 4, 0)
+        # levels are created when the player enters them for the first time
+        Game.level_sources = [level1, level2, level3] if levels is None else list(levels)
+        Game.dungeon = [None for level in Game.level_sources]
+        self.enter_level(0)
+
+        if levels is None:
+            # extra food on2,4
+            Food(2, 4, 0)
         # --------extra effects at start of game --------------
         # Fire(3, 1, max_age=5)
         # Fire(3, 2, max_age=7)
@@ -664,13 +1359,319 @@ class Game:
         self.calculate_fov()
         Game.turn_number = 0
 
+    @staticmethod
+    def reset():
+        """clear all class-level game state, so that more than one game can run in the same process"""
+        Game.player = None
+        Game.dungeon = []
+        Game.level_sources = []
+        Game.level_visits = []
+        Game.compacted = {}
+        Game.zoo = {}
+        Game.casualties = []
+        Game.items = {}
+        Game.effects = {}
+        Game.new_fires = {}
+        Game.events = []
+        Game.fov_cache = {}
+        Game.fov_applied = {}
+        Game.light_applied = {}
+        Game.distance_maps = {}
+        Game.schedule = []
+        Game.active_chunks = set()
+        Game.monsternumber = 0
+        Game.itemnumber = 0
+        Game.effectnumber = 0
+        Game.turn_number = 0
+        Game.running = True
+        Game.zoo_index.clear()
+        Game.zoo_chunks.clear()
+        Game.item_index.clear()
+        Game.effect_index.clear()
+
+    @staticmethod
+    def present(func, *args, **kwargs):
+        """queue a presentation side effect (creating a Flytext, Bubbles, a FlyingObject...)
+        instead of calling func directly. Game rules must not create sprites themselves,
+        because the game can run without display (headless).
+        The Viewer calls every queued func once per frame, see Viewer.consume_events.
+        In headless mode, events are dropped unless Game.keep_events is True"""
+        if Game.headless and not Game.keep_events:
+            return
+        Game.events.append((func, args, kwargs))
+
+    @staticmethod
+    def monsters_at(z, x, y):
+        """returns a list of all living monsters (including the player) at tile x,y,z"""
+        return [m for m in Game.zoo_index.at((z, x, y)) if m.hp > 0]
+
+    @staticmethod
+    def items_at(z, x, y):
+        """returns a list of all items lying at tile x,y,z (items in backpack are ignored)"""
+        return Game.item_index.at((z, x, y))
+
+    @staticmethod
+    def effects_at(x, y):
+        """returns a list of all effects at tile x,y of the current dungeon level"""
+        return Game.effect_index.at((x, y))
+
+    def clear_effects(self):
+        """remove all effects, necessary when the player changes the dungeon level"""
+        for e in Game.effects.values():
+            e.release()
+        Game.effects = {}
+        Game.new_fires = {}
+        level = Game.dungeon[Game.player.z]
+        level.fire_front = [np.nonzero(level.burning)]  # burning oil needs new Fire effects
+        Game.effect_index.clear()
+
+    @staticmethod
+    def distance_map(z):
+        """returns (distances, left, top): distances is a numpy array [y, x] with the number of steps
+        (8 directions) to the player for each tile of the window of level z that starts at tile left, top,
+        -1 for tiles that block movement (walls, closed doors...), can not be reached
+        or are farther away than Game.path_radius.
+        The window reaches Game.path_radius tiles from the player, so its size does not depend on the
+        size of the level. One breadth first flood fill, shared by all monsters. It is only
+        calculated again if the player moves or a tile changes block_movement (Level.movement_version)"""
+        level = Game.dungeon[z]
+        key = (Game.player.x, Game.player.y, level.movement_version, Game.path_radius)
+        cached = Game.distance_maps.get(z)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        left = max(0, Game.player.x - Game.path_radius)
+        top = max(0, Game.player.y - Game.path_radius)
+        right = min(level.width, Game.player.x + Game.path_radius + 1)
+        bottom = min(level.height, Game.player.y + Game.path_radius + 1)
+        # flat index with a blocking border of one tile around the window: no bounds checks necessary
+        width = right - left + 2
+        free = np.zeros((bottom - top + 2, width), dtype=bool)
+        free[1:-1, 1:-1] = ~level.block_movement[top:bottom, left:right]
+        free = free.ravel()
+        distances = np.full(free.size, -1, dtype=np.int32)
+        offsets = Game.neighbors_dy * width + Game.neighbors_dx
+        start = (Game.player.y - top + 1) * width + Game.player.x - left + 1
+        distances[start] = 0
+        free[start] = False
+        frontier = np.array([start])
+        for d in range(1, Game.path_radius + 1):
+            # all free neighbors of the frontier are one step farther away
+            neighbors = (frontier[:, np.newaxis] + offsets).ravel()
+            frontier = np.unique(neighbors[free[neighbors]])
+            if frontier.size == 0:
+                break
+            free[frontier] = False
+            distances[frontier] = d
+        distances = distances.reshape(bottom - top + 2, width)[1:-1, 1:-1]
+        Game.distance_maps[z] = (key, (distances, left, top))
+        return distances, left, top
+
+    @staticmethod
+    def distance(z, x, y):
+        """number of steps from tile x,y of level z to the player, -1 if not on the distance map"""
+        distances, left, top = Game.distance_map(z)
+        height, width = distances.shape
+        if 0 <= x - left < width and 0 <= y - top < height:
+            return int(distances[y - top, x - left])
+        return -1
+
+    @staticmethod
+    def monsters_near_player():
+        """returns a list of all monsters (including the player) in the chunks around the chunk
+        of the player (see Game.simulation_chunks), sorted by number.
+        Only those monsters act and get their buffs updated each turn"""
+        size = Level.chunk_size
+        z, cx, cy = Game.player.z, Game.player.x // size, Game.player.y // size
+        r = Game.simulation_chunks
+        monsters = []
+        for dy in range(-r, r + 1):
+            for dx in range(-r, r + 1):
+                monsters.extend(Game.zoo_chunks.at((z, cx + dx, cy + dy)))
+        return sorted(monsters, key=lambda m: m.number)
+
+    @staticmethod
+    def monsters_around(z, x, y, radius):
+        """returns a list of all monsters (including the player) of level z
+        at most radius tiles away from tile x,y (in x and in y direction).
+        Only the chunks of that square are searched, see Game.zoo_chunks"""
+        size = Level.chunk_size
+        monsters = []
+        for cy in range((y - radius) // size, (y + radius) // size + 1):
+            for cx in range((x - radius) // size, (x + radius) // size + 1):
+                monsters.extend(
+                    m
+                    for m in Game.zoo_chunks.at((z, cx, cy))
+                    if abs(m.x - x) <= radius and abs(m.y - y) <= radius
+                )
+        return monsters
+
+    @staticmethod
+    def schedule_monster(monster, turn):
+        """monster acts (or wakes up, if dormant) in turn (float), see due_monsters"""
+        monster.due = turn
+        heapq.heappush(Game.schedule, (turn, monster.number))
+
+    @staticmethod
+    def doze(monster):
+        """monster goes dormant: its timer wakes it up at a random turn within the next Game.dormant_turns
+        (so that the monsters of a chunk do not all wake up in the same turn)"""
+        monster.dormant = True
+        Game.schedule_monster(monster, Game.turn_number + random.random() * Game.dormant_turns)
+
+    @staticmethod
+    def activate_chunks():
+        """the monsters of chunks that just became simulated (see Game.simulation_chunks) get their timer (see doze).
+        Monsters outside of the simulated chunks are not in Game.schedule at all (see due_monsters),
+        the timers they missed are resolved here, when the player comes near again"""
+        hero = Game.player
+        z, cx, cy = hero.chunk_key()
+        r = Game.simulation_chunks
+        active = {(z, cx + dx, cy + dy) for dy in range(-r, r + 1) for dx in range(-r, r + 1)}
+        for key in active - Game.active_chunks:
+            for m in Game.zoo_chunks.at(key):
+                if m.due is None and m.hp > 0 and m is not hero:
+                    Game.doze(m)
+        Game.active_chunks = active
+
+    @staticmethod
+    def wake(monster):
+        """a dormant (or never scheduled) monster acts already in this turn
+        and stays awake for at least Game.awake_turns"""
+        if monster is Game.player or monster.hp <= 0:
+            return
+        if monster.dormant or monster.due is None:
+            monster.dormant = False
+            monster.awake_until = Game.turn_number + Game.awake_turns
+            Game.schedule_monster(monster, Game.turn_number)
+
+    @staticmethod
+    def noise(z, x, y, radius):
+        """a noise at tile x,y of level z wakes up all monsters within radius"""
+        for m in Game.monsters_around(z, x, y, radius):
+            Game.wake(m)
+
+    def wake_monsters(self):
+        """wakes up the monsters within Game.activation_radius of the player
+        and the monsters the player can see"""
+        hero = Game.player
+        level = Game.dungeon[hero.z]
+        radius = Game.activation_radius
+        for m in Game.monsters_around(hero.z, hero.x, hero.y, max(radius, Game.torch_radius)):
+            if max(abs(m.x - hero.x), abs(m.y - hero.y)) <= radius or level.fov[m.y, m.x]:
+                Game.wake(m)
+
+    def due_monsters(self):
+        """yields the monsters that act in this turn, in the order of Game.schedule (a heap).
+        Each monster gains its .speed as energy every turn and acts whenever it has Game.action_energy:
+        speed 200 acts twice per turn, speed 50 every second turn.
+        Monsters that are farther away than Game.activation_radius, not seen by the player
+        and not woken up recently go dormant instead. They stay out of the way until a noise (see noise) or the player (see wake_monsters)
+        wakes them up. Every Game.dormant_turns their timer lets them take one step (see wander).
+        Monsters outside of the simulated chunks leave Game.schedule until their chunk is simulated again (see activate_chunks).
+        So the cost of a turn depends on the monsters near the player, not on all monsters of the level"""
+        hero = Game.player
+        level = Game.dungeon[hero.z]
+        while Game.schedule and Game.schedule[0][0] <= Game.turn_number:
+            due, number = heapq.heappop(Game.schedule)
+            m = Game.zoo.get(number)
+            if m is None or m.due != due:
+                continue  # removed monster, or the monster was woken up and has a newer entry
+            if m.hp <= 0 or m.chunk_key() not in Game.active_chunks:
+                m.due, m.dormant = None, True  # see activate_chunks
+                continue
+            far = max(abs(m.x - hero.x), abs(m.y - hero.y)) > Game.activation_radius and not level.fov[m.y, m.x]
+            if m.dormant and far:
+                Game.wander(m, level)  # timer far away from the player: one step, no chunk is created
+                Game.schedule_monster(m, due + Game.dormant_turns)
+                continue
+            if m.dormant:
+                m.dormant = False  # timer: act once, then check the distance again
+            elif far and Game.turn_number >= m.awake_until:
+                m.dormant = True
+                Game.schedule_monster(m, due + Game.dormant_turns)
+                continue
+            if due <= Game.turn_number - 1:
+                due = Game.turn_number  # woken up between turns: no catching up on missed turns
+            Game.schedule_monster(m, due + Game.action_energy / m.speed)
+            yield m
+
+    @staticmethod
+    def wander(monster, level):
+        """monster takes one random step, if the tile is free: only the arrays of level
+        and Game.zoo_index are used, so that a monster far away does not create a chunk (see Level.chunk)"""
+        i = random.randrange(len(Game.neighbors_dx))
+        x, y = monster.x + int(Game.neighbors_dx[i]), monster.y + int(Game.neighbors_dy[i])
+        if not (0 <= x < level.width and 0 <= y < level.height):
+            return
+        if not level.block_movement[y, x] and not Game.monsters_at(monster.z, x, y):
+            monster.x, monster.y = x, y
+
+    @staticmethod
+    def path_step(monster, flee=False):
+        """returns (dx, dy) of the best step for monster on the distance map of its level:
+        towards the player, or away from the player if flee is True (the inverted map).
+        (0, 0) if no neighboring tile is better, None if the monster is not on the map
+        (not on the level of the player, or too far away)"""
+        if monster.z != Game.player.z:
+            return None
+        best_distance = Game.distance(monster.z, monster.x, monster.y)
+        if best_distance < 0:
+            return None
+        best = (0, 0)
+        for dx, dy in zip(Game.neighbors_dx.tolist(), Game.neighbors_dy.tolist()):
+            d = Game.distance(monster.z, monster.x + dx, monster.y + dy)
+            if d < 0:
+                continue
+            if (d > best_distance) if flee else (d < best_distance):
+                best, best_distance = (dx, dy), d
+        return best
+
+    def spread_fire(self, level):
+        """fire / oil simulation for one turn. Only the burning front is processed,
+        (tiles that started burning since the last turn), not the whole level:
+        the front gets Fire effects that last as long as the oil burns,
+        then burning spreads from the front to all neighboring (8 directions) Oil tiles.
+        Finally each new Fire effect (see Game.new_fires) on oil that is not burning yet ignites it with a chance of 0.2.
+        The Fire effects of the tiles burning since earlier turns are never looked at again.
+        All random decisions use the random module: seed it for reproducible runs"""
+        front = level.fire_front
+        level.fire_front = []
+        if front:
+            ys = np.concatenate([np.atleast_1d(f[0]) for f in front])
+            xs = np.concatenate([np.atleast_1d(f[1]) for f in front])
+            # create flames from burning oil
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                Fire(tx=x, ty=y, max_age=None)
+            # spread fire to other oil: all 8 neighbors of all front tiles at once
+            ny = (ys[:, np.newaxis] + Game.neighbors_dy).ravel()
+            nx = (xs[:, np.newaxis] + Game.neighbors_dx).ravel()
+            inside = (ny >= 0) & (ny < level.height) & (nx >= 0) & (nx < level.width)
+            ny, nx = ny[inside], nx[inside]
+            catch = (level.kind[ny, nx] == Oil.code) & ~level.burning[ny, nx]
+            if catch.any():
+                cells = np.unique(ny[catch] * level.width + nx[catch])  # sorted, no duplicates
+                level.ignite(cells // level.width, cells % level.width)
+        # ---- new Fire on Oil makes Oil burning
+        new_fires = Game.new_fires
+        Game.new_fires = {}
+        for number, e in new_fires.items():
+            if Game.effects.get(number) is e and 0 <= e.tx < level.width and 0 <= e.ty < level.height:
+                if level.kind[e.ty, e.tx] == Oil.code and not level.burning[e.ty, e.tx]:
+                    if random.random() < 0.2:  # chance to ignite
+                        level.ignite(e.ty, e.tx)
+
     def process_effects(self):
-        """next turn for each effect and remove destroyed effects"""
+        """next turn for each effect and remove destroyed effects
+        (destroyed effects go back into the pool of their class, see Effect.release)"""
+        destroyed = []
         for e in Game.effects.values():
             e.next_turn()
-        Game.effects = {
-            k: v for k, v in Game.effects.items() if not v.destroy
-        }  # remove destroyed effects
+            if e.destroy:
+                destroyed.append(e)
+        for e in destroyed:
+            del Game.effects[e.number]
+            Game.effect_index.remove((e.tx, e.ty), e)
+            e.release()
 
     def create_dungeon2(self, raw_level, z):
         """append or replace level z in Game.dungeons, created from raw_level
@@ -680,108 +1681,358 @@ class Game:
         :param int z:           index of the new level in Game.dungeons. Use to append / replace level
         :return: None
         """
-        raw = [list(line) for line in raw_level.splitlines() if len(line) > 1]
-        new_level = []
-        for ty, line in enumerate(raw):
-            new_line = []
-            for tx, char in enumerate(line):
-                # monsters (including the player) and items generate a floor tile
-                myclass = legend[char]  # legend is a top-level variable
-                classnames = [
-                    c.__name__ for c in myclass.mro()
-                ]  # classname.mro() displays all superclasses
-                if "Monster" in classnames or "Item" in classnames:
-                    new_line.append(Floor())
-                    if char == "@":
-                        Game.player = Player(tx, ty, z)
-                    else:
-                        myclass(
-                            tx, ty, z
-                        )  # Monsters go to Game.zoo, Items go to Game.items
-                else:
-                    new_line.append(myclass())
-            new_level.append(new_line)
+        self.create_level(*compile_level(raw_level), z)
+
+    def create_level(self, kind, spawns, z):
+        """append or replace level z in Game.dungeons, created from a compiled level (see compile_level):
+        a Level of the tile codes in kind, one Monster or Item for each spawn
+
+        :param kind:    numpy array [y, x] of tile codes (index of the Structure subclass in Level.kinds)
+        :param spawns:  numpy array of (char, x, y), char is the code point of a Monster or Item in legend
+        :param int z:   index of the new level in Game.dungeons. Use to append / replace level
+        :return: the new Level
+        """
+        # monsters (including the player) and items stand on floor tiles, see compile_level
+        for char, tx, ty in spawns.tolist():
+            if chr(char) == "@":
+                Game.player = Player(tx, ty, z)
+            else:
+                legend[chr(char)](tx, ty, z)  # Monsters go to Game.zoo, Items go to Game.items
+        return self.place_level(Level(kind), z)
+
+    def place_level(self, new_level, z):
+        """append or replace level z in Game.dungeons with new_level.
+        The Structure objects and their pictures are created later, chunk by chunk (see Level.chunk)
+
+        :return: new_level
+        """
         # ------------ append (or replace) new level to Game.dungeon -----------------------------
         if z == len(Game.dungeon):
             Game.dungeon.append(new_level)
         elif 0 <= z < len(Game.dungeon):
             Game.dungeon[z] = new_level
+            Game.fov_cache.pop(z, None)  # forget fov of the old level
+            Game.fov_applied.pop(z, None)
+            Game.light_applied.pop(z, None)
+            Game.distance_maps.pop(z, None)
         else:
             raise ValueError("z too big for Game.dungeon")
-        # --------------------- create picture for each structure tile , depending on neighbors -----------------------
-        for ty, line in enumerate(new_level):
-            for tx, tile in enumerate(line):
-                neighbors = []
-                # for dx, dy in [(0,-1), (1,-1),(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1)]:
-                for dx, dy in [(0, -1), (1, 0), (0, 1), (-1, 0)]:
-                    if (
-                        tx + dx < 0
-                        or tx + dx >= len(line)
-                        or ty + dy < 0
-                        or ty + dy >= len(new_level)
-                    ):
-                        neighbors.append(None)
-                        continue
-                    neighbors.append(new_level[ty + dy][tx + dx])
-                Game.dungeon[z][ty][tx].create_pictures(neighbors)
-
-    def bgcolor(self, distance, mingrey=0, maxgrey=255):
-        """calculates a background (grey) color value, depending on
-        distance from torch (player)
-        close to torch -> maxgrey
-        far away from torch ->mingrey"""
-        distance = min(distance, Game.torch_radius)
-        greydiff = maxgrey - mingrey
-        d = distance / Game.torch_radius
-        return 255 - int(mingrey + d * greydiff)
-
-    def calculate_fov_points(self, points):
-        """needs a points-list (from Bresham's get_line method)
-        starting from player position to tile"""
-        z = Game.player.z
-        for point in points:
-            x, y = point[0], point[1]
+        return new_level
+
+    def enter_level(self, z):
+        """make sure Game.dungeon[z] is materialized: created from Game.level_sources[z]
+        when the player enters it for the first time, or restored from its compact form.
+        Afterwards the least recently entered levels above Game.level_limit are compacted"""
+        if Game.dungeon[z] is None:
+            source = Game.level_sources[z]
+            if z in Game.compacted:
+                self.restore_level(z)
+            elif isinstance(source, dict):
+                self.create_level(*generate_level(**source), z)
+            elif source.endswith(".txt"):
+                self.create_level(*read_level(source), z)
+            else:
+                self.create_dungeon2(source, z)
+        if z in Game.level_visits:
+            Game.level_visits.remove(z)
+        Game.level_visits.append(z)
+        self.evict_levels()
+
+    def evict_levels(self):
+        """compact the least recently entered levels until only Game.level_limit levels are materialized.
+        The level of the player is never compacted"""
+        for z in list(Game.level_visits):
+            if len(Game.level_visits) <= max(1, Game.level_limit):
+                break
+            if Game.player is not None and z == Game.player.z:
+                continue
+            self.compact_level(z)
+
+    def compact_level(self, z):
+        """replace level z in Game.dungeon with None and store it in Game.compacted instead:
+        the tile codes, the explored and burning masks as packed bits, the state of
+        doors and terminals (see Structure.state_attributes) and the pickled monsters and
+        items of that level, which are removed from Game.zoo and Game.items.
+        No Structure objects and no pictures are kept"""
+        level = Game.dungeon[z]
+        states = level.structure_states()
+        monsters = [m for m in Game.zoo.values() if m.z == z and m is not Game.player]
+        items = [i for i in Game.items.values() if i.z == z and not i.backpack]
+        for entity in monsters + items:
+            entity.remove()
+        Game.compacted[z] = {
+            "shape": level.kind.shape,
+            "kind": level.kind.copy(),
+            "explored": np.packbits(level.explored),
+            "burning": np.packbits(level.burning),
+            "entities": pickle.dumps((states, monsters, items)),
+        }
+        Game.dungeon[z] = None
+        Game.level_visits.remove(z)
+        for cache in (Game.fov_cache, Game.fov_applied, Game.light_applied, Game.distance_maps):
+            cache.pop(z, None)
+
+    def restore_level(self, z):
+        """materialize level z again from Game.compacted, see compact_level"""
+        compact = Game.compacted.pop(z)
+        height, width = compact["shape"]
+        states, monsters, items = pickle.loads(compact["entities"])
+        level = self.rebuild_level(compact["kind"], states, z)
+        for name in ("explored", "burning"):
+            bits = np.unpackbits(compact[name], count=height * width)
+            getattr(level, name)[:] = bits.reshape(height, width).astype(bool)
+        level.fire_front = [np.nonzero(level.burning)]
+        for entity in monsters + items:
+            Game.adopt(entity)
+        for monster in monsters:
+            monster.due, monster.dormant = None, True  # not in Game.schedule any more, see activate_chunks
+
+    def rebuild_level(self, kind, states, z):
+        """append or replace level z in Game.dungeons, created from its tile codes
+        and the state of its doors and terminals (see Level.structure_states). No monsters or items
+
+        :return: the new Level
+        """
+        level = self.place_level(Level(kind), z)
+        level.restore_states(states)
+        return level
+
+    @staticmethod
+    def adopt(entity):
+        """put an unpickled Monster, Item or Effect back into Game.zoo, Game.items or Game.effects
+        and into its spatial index, see restore_level and SaveFile"""
+        if isinstance(entity, Monster):
+            Game.zoo[entity.number] = entity
+            Game.zoo_index.add((entity.z, entity.x, entity.y), entity)
+            Game.zoo_chunks.add(entity.chunk_key(), entity)
+        elif isinstance(entity, Item):
+            Game.items[entity.number] = entity
+            if not entity.backpack:
+                Game.item_index.add((entity.z, entity.x, entity.y), entity)
+        else:
+            Game.effects[entity.number] = entity
+            Game.effect_index.add((entity.tx, entity.ty), entity)
+
+    @staticmethod
+    def light_kernel(radius, center=None, mingrey=32, maxgrey=255):
+        """square numpy array (2*radius+1) with the grey value of a light source
+        in the middle, depending on the distance to the middle:
+        close to the light -> maxgrey, at radius -> mingrey, outside of radius -> 0
+        center: grey value of the middle tile itself, if not None
+        kernels are calculated once for each radius and then cached in Game.light_kernels"""
+        key = (radius, center, mingrey, maxgrey)
+        if key not in Game.light_kernels:
+            dy, dx = np.mgrid[-radius : radius + 1, -radius : radius + 1]
+            distance = np.sqrt(dx * dx + dy * dy)
+            d = np.minimum(distance, radius) / max(radius, 1)
+            kernel = 255 - (mingrey + d * (maxgrey - mingrey)).astype(np.int16)
+            kernel[distance > radius] = 0
+            if center is not None:
+                kernel[radius, radius] = center
+            Game.light_kernels[key] = kernel
+        return Game.light_kernels[key]
+
+    def calculate_fov_points(self, offsets, visible):
+        """needs a tuple of offsets (from Bresham's line_offsets function)
+        starting from player position to tile.
+        adds (x,y) of each visible tile to the set visible"""
+        px, py = Game.player.x, Game.player.y
+        level = Game.dungeon[Game.player.z]
+        radius_squared = Game.torch_radius * Game.torch_radius
+        for ox, oy in offsets:
+            x, y = px + ox, py + oy
             # player tile always visible
-            if x == Game.player.x and y == Game.player.y:
-                Game.dungeon[z][y][
-                    x
-                ].fov = True  # make this tile visible and move to next point
-                Game.dungeon[z][y][x].explored = True
-                # Game.dungeon[z][y][x].bgcolor = Game.player.fgcolor + " on " + "rgb(200,200,200)"
-                Game.dungeon[z][y][x].bgcolor = (200, 200, 200)
+            if ox == 0 and oy == 0:
+                visible.add((x, y))
                 continue
             # outside of dungeon level ?
+            if x < 0 or y < 0:
+                continue  # negative index would wrap around
             try:
-                tile = Game.dungeon[z][y][x]
+                block_sight = level.block_sight[y, x]
             except IndexError:
                 continue  # outside of dungeon error
             # outside of torch radius ?
-            distance = ((Game.player.x - x) ** 2 + (Game.player.y - y) ** 2) ** 0.5
-            if distance > Game.torch_radius:
+            if ox * ox + oy * oy > radius_squared:
                 continue
-            # distance 0: max light (255)
-            # distance == torch_radius: minimum light (128)
-            g = self.bgcolor(distance, 32, 255)
-            # Game.dungeon[z][y][x].bgcolor = f"rgb({g},{g},{g})"
-            Game.dungeon[z][y][x].bgcolor = (g, g, g)
-            Game.dungeon[z][y][x].fov = True  # make this tile visible
-            Game.dungeon[z][y][x].explored = True
-            if tile.block_sight:
+            visible.add((x, y))
+            if block_sight:
                 break  # forget the rest
 
+    @staticmethod
+    def opacity_changed():
+        """must be called whenever a tile changes .block_sight (doors, terminals...)
+        invalidates all cached field of view results"""
+        Game.opacity_version += 1
+
     def calculate_fov(self):
+        """calculate the field of view of the player (torch) for the current level
+        sets .fov and .explored of each tile, then calls calculate_light.
+        The algorithm depends on Game.fov_engine:
+        "shadowcasting": recursive shadowcasting, each tile inside the torch radius is visited once
+        "raycasting": Bresenham rays to the edge of the torch square, plus artifact cleanup
+
+        Results are cached per level as numpy index arrays, keyed on player position, torch_radius and Game.opacity_version.
+        Nothing is calculated if the player did not move and no door was opened or closed.
+        Otherwise, only tiles that enter or leave the field of view are updated.
+        """
         self.process_effects()
-        ##Game.fov_map = []
-        # self.checked = set() # clear the set of checked coordinates
-        # checked = set() # clear set. a coordinate con only be once in a set.
         px, py, pz = Game.player.x, Game.player.y, Game.player.z
-        # fmap = Game.dungeon[pz]
-        # set all tiles to False
-        for line in Game.dungeon[pz]:
-            for tile in line:
-                tile.fov = False
-        # set player's tile to visible
-        Game.dungeon[pz][py][px].fov = True
+        key = (px, py, Game.torch_radius, Game.opacity_version, Game.fov_engine)
+        old_key, old_visible = Game.fov_applied.get(pz, (None, None))
+        if key == old_key:
+            self.calculate_light()  # fov unchanged, but light sources may have moved
+            return
+        cache = Game.fov_cache.setdefault(pz, {})
+        if key in cache:
+            visible = cache.pop(key)  # re-insert below -> least recently used is first in dict
+        else:
+            if Game.fov_engine == "raycasting":
+                lit = self.calculate_fov_raycasting()
+                # store as numpy index arrays ys, xs
+                n = len(lit)
+                visible = (
+                    np.fromiter((y for x, y in lit), np.intp, n),
+                    np.fromiter((x for x, y in lit), np.intp, n),
+                )
+            else:
+                visible = self.calculate_fov_shadowcasting()
+        cache[key] = visible
+        while len(cache) > Game.fov_cache_size:
+            del cache[next(iter(cache))]
+        # ------- update only tiles that leave or enter the field of view ------
+        level = Game.dungeon[pz]
+        if old_visible is None:
+            level.fov[:] = False  # first calculation for this level
+        else:
+            level.fov[old_visible[0], old_visible[1]] = False
+        ys, xs = visible
+        level.fov[ys, xs] = True
+        new = ~level.explored[ys, xs]
+        if new.any():
+            level.explored[ys, xs] = True
+            level.mark_changed(ys[new], xs[new])
+        Game.fov_applied[pz] = (key, visible)
+        self.calculate_light()
+
+    def calculate_light(self):
+        """light map stage: adds the light kernels of all light sources
+        (the torch of the player and each Effect with a light_radius > 0)
+        inside one bounding box, masks the sum with the field of view
+        and writes it into Level.light of the current level (0 outside the field of view).
+        Nothing is done if the field of view and all light sources are unchanged"""
+        pz = Game.player.z
+        level = Game.dungeon[pz]
+        sources = [(Game.player.x, Game.player.y, Game.torch_radius, 200)]
+        sources.extend(
+            (e.tx, e.ty, e.light_radius, None)
+            for e in Game.effects.values()
+            if e.light_radius > 0 and e.age >= 0
+        )
+        key = (Game.fov_applied[pz][0], tuple(sources))
+        old_key, old_box = Game.light_applied.get(pz, (None, None))
+        if key == old_key:
+            return
+        if old_box is None:
+            level.light[:] = 0  # first calculation for this level
+        else:
+            level.light[old_box] = 0
+        # ---- bounding box of all light sources, clipped to the level ----
+        left = max(0, min(x - r for x, y, r, c in sources))
+        top = max(0, min(y - r for x, y, r, c in sources))
+        right = min(level.width, max(x + r + 1 for x, y, r, c in sources))
+        bottom = min(level.height, max(y + r + 1 for x, y, r, c in sources))
+        box = (slice(top, bottom), slice(left, right))
+        total = np.zeros((bottom - top, right - left), dtype=np.int16)
+        for x, y, r, center in sources:
+            kernel = self.light_kernel(r, center)
+            # part of the kernel that is inside the level
+            x1, y1 = max(0, x - r), max(0, y - r)
+            x2, y2 = min(level.width, x + r + 1), min(level.height, y + r + 1)
+            if x1 >= x2 or y1 >= y2:
+                continue  # light source outside of level
+            total[y1 - top : y2 - top, x1 - left : x2 - left] += kernel[
+                y1 - y + r : y2 - y + r, x1 - x + r : x2 - x + r
+            ]
+        total[~level.fov[box]] = 0
+        level.light[box] = np.minimum(total, 255)
+        Game.light_applied[pz] = (key, box)
+
+    def calculate_fov_shadowcasting(self):
+        """field of view by recursive shadowcasting, each tile inside the torch radius is visited once.
+        The recursion is a stack of scans (row, start slope, end slope) for each octant, working on
+        the torch square only: block_sight as bytes (outside of the level counts as wall) and a bytearray of lit tiles.
+        returns numpy index arrays (ys, xs) of all visible tiles
+        see http://www.roguebasin.com/index.php?title=FOV_using_recursive_shadowcasting
+        """
+        px, py = Game.player.x, Game.player.y
+        level = Game.dungeon[Game.player.z]
+        radius = Game.torch_radius
+        radius_squared = radius * radius
+        side = 2 * radius + 1
+        left, top = px - radius, py - radius
+        # ---- the torch square, clipped to the level ----
+        x1, y1 = max(left, 0), max(top, 0)
+        x2, y2 = min(px + radius + 1, level.width), min(py + radius + 1, level.height)
+        clip = (slice(y1 - top, y2 - top), slice(x1 - left, x2 - left))
+        inside = np.zeros((side, side), dtype=bool)
+        inside[clip] = True
+        window = np.ones((side, side), dtype=np.uint8)
+        window[clip] = level.block_sight[y1:y2, x1:x2]
+        opaque = window.tobytes()
+        lit = bytearray(side * side)
+        center = radius * side + radius
+        lit[center] = 1
+        for xx, xy, yx, yy in Game.octants:
+            # index in the torch square of the octant coordinates dx, dy: center + dx * step_x + dy * step_y
+            step_x, step_y = yx * side + xx, yy * side + xy
+            scans = [(1, 1.0, 0.0)]
+            while scans:
+                row, start, end = scans.pop()
+                if start < end:
+                    continue
+                new_start = 0.0
+                for j in range(row, radius + 1):
+                    dx, dy = -j - 1, -j
+                    base = center + dy * step_y
+                    blocked = False
+                    while dx <= 0:
+                        dx += 1
+                        # left and right slope of this tile
+                        left_slope = (dx - 0.5) / (dy + 0.5)
+                        right_slope = (dx + 0.5) / (dy - 0.5)
+                        if start < right_slope:
+                            continue
+                        elif end > left_slope:
+                            break
+                        i = base + dx * step_x
+                        if dx * dx + dy * dy <= radius_squared:
+                            lit[i] = 1  # tile is lit by the torch
+                        if blocked:
+                            # scanning a row of blocked tiles
+                            if opaque[i]:
+                                new_start = right_slope
+                                continue
+                            blocked = False
+                            start = new_start
+                        elif opaque[i] and j < radius:
+                            # this is a blocking tile, start a child scan
+                            blocked = True
+                            scans.append((j + 1, start, left_slope))
+                            new_start = right_slope
+                    # row is scanned, do next row unless last tile was blocked
+                    if blocked:
+                        break
+        ys, xs = np.nonzero(np.frombuffer(lit, dtype=np.uint8).reshape(side, side) & inside)
+        return ys + top, xs + left
+
+    def calculate_fov_raycasting(self):
+        """field of view by casting Bresenham rays from the player to each tile
+        at the edge of the torch square, see calculate_fov_points.
+        returns a set {(x,y)} of all visible tiles"""
+        px, py, pz = Game.player.x, Game.player.y, Game.player.z
+        kind = Game.dungeon[pz].kind
+        visible = {(px, py)}
         # get coordinates form player to point at end of torchradius / torchsquare
         endpoints = set()
         for y in range(py - Game.torch_radius, py + Game.torch_radius + 1):
@@ -793,8 +2044,8 @@ class Game:
                 endpoints.add((px + Game.torch_radius, y))
         for coordinate in endpoints:
             # a line of points from the player position to the outer edge of the torchsquare
-            points = get_line((px, py), (coordinate[0], coordinate[1]))
-            self.calculate_fov_points(points)
+            offsets = line_offsets(coordinate[0] - px, coordinate[1] - py)
+            self.calculate_fov_points(offsets, visible)
         # print(Game.fov_map)
         # ---------- the fov map is now ready to use, but has some ugly artifacts ------------
         # ---------- start post-processing fov map to clean up the artifacts ---
@@ -821,11 +2072,17 @@ class Game:
                     # not even in fov?
                     # visible = Game.dungeon[pz][py][px].fov#[y][x]
                     # if visible:
-                    if Game.dungeon[pz][py][px].fov:
+                    if y < 0 or x < 0:
+                        continue  # negative index would wrap around
+                    try:
+                        candidate = kind[y, x]
+                    except IndexError:
+                        continue  # outside of dungeon
+                    if (x, y) in visible:
                         continue  # next, i search invisible tiles!
                     # oh, we found an invisble tile! now let's check:
                     # is it a wall?
-                    if isinstance(Game.dungeon[pz][y][x], Wall):  ##char != "#":
+                    if candidate != Wall.code:  ##char != "#":
                         continue  # next, i search walls!
                     # --ok, found an invisible wall.
                     # check south-east neighbors
@@ -836,16 +2093,16 @@ class Game:
                             continue  # negative index
                         try:
                             # v = Game.dungeon[pz][y + dy][x + dx].fov
-                            t = Game.dungeon[pz][y + dy][x + dx]
+                            t = kind[y + dy, x + dx]
                         except IndexError:
                             continue
                         # is neighbor a tile AND visible?
-                        if isinstance(t, Floor) and t.fov:
+                        if t == Floor.code and (x + dx, y + dy) in visible:
                             # ok, found a visible floor tile neighbor. now let's make this wall
                             # visible as well
-                            Game.dungeon[pz][y][x].fov = True
-                            Game.dungeon[pz][y][x].explored = True
+                            visible.add((x, y))
                             break  # other neighbors are irrelevant now
+        return visible
 
     def move(self, monster, dx, dy):
         """
@@ -876,15 +2133,17 @@ class Game:
                 if not target.locked:
                     text.append("You open the door withou using a key")
                     target.open()
+                    Game.noise(monster.z, target.x, target.y, 8)
                 elif keys <= 0:
                     text.append("You need to find a key to open this door")
                 else:
                     text.append("You open the door but loose a key")
                     target.open()  # open the door
+                    Game.noise(monster.z, target.x, target.y, 8)
                     for i2 in Game.items.values():
                         if i2.backpack and isinstance(i2, Key):
                             break  # found a suitable key to use & destroy
-                    del Game.items[i2.number]  # destroy key
+                    i2.remove()  # destroy key
         if not legal:
             dx, dy = 0, 0
             if isinstance(monster, Player):  # only the player creates text msg
@@ -893,13 +2152,8 @@ class Game:
             # check for fight with monsters / players
             for m in [
                 m
-                for m in Game.zoo.values()
-                if m.z == monster.z
-                and m.number != monster.number
-                and m.friendly != monster.friendly
-                and m.hp > 0
-                and m.x == monster.x + dx
-                and m.y == monster.y + dy
+                for m in Game.monsters_at(monster.z, monster.x + dx, monster.y + dy)
+                if m.number != monster.number and m.friendly != monster.friendly
             ]:
                 dx, dy = 0, 0
                 text.extend(fight(monster, m))
@@ -919,6 +2173,7 @@ class Game:
             tile = Game.dungeon[hero.z][hero.y + vy][hero.x + vx]
             if isinstance(tile, Door) and not tile.closed:
                 tile.close()
+                Game.noise(hero.z, tile.x, tile.y, 8)
                 text.append("You close the open door")
                 self.calculate_fov()
                 break
@@ -933,7 +2188,8 @@ class Game:
         text = []
         if isinstance(Game.dungeon[hero.z][hero.y][hero.x], StairUp):
             hero.z -= 1  # deeper down -> bigger z
-            Game.effects = {}  # clear all effects
+            self.enter_level(hero.z)
+            self.clear_effects()
             text.append("You climb one level up")
             # self.make_empty_effect_map()
             self.calculate_fov()
@@ -949,7 +2205,8 @@ class Game:
         text = []
         if isinstance(Game.dungeon[hero.z][hero.y][hero.x], StairDown):
             hero.z += 1  # deeper down -> bigger z
-            Game.effects = {}  # clear all effects
+            self.enter_level(hero.z)
+            self.clear_effects()
             text.append("You climb one level down")
             # self.make_empty_effect_map()
             self.calculate_fov()
@@ -965,7 +2222,7 @@ class Game:
         myfood = food[0]
         quality = myfood.food_value  # 1,2 or 3
         self.player.hp += myfood.food_value
-        del Game.items[myfood.number]
+        myfood.remove()
         return [f"you eat food and regain {quality} hp"]
 
     def turn(self, dx, dy):
@@ -977,7 +2234,7 @@ class Game:
         # tile = Game.dungeon[hero.z][hero.y][hero.x]
         # ------- update all buffs -----
         # ------ update buffs of each monster -----
-        for m in [m for m in Game.zoo.values() if m.z == hero.z and m.hp > 0]:
+        for m in [m for m in Game.monsters_near_player() if m.hp > 0]:
             for b in m.buffs:
                 b.update()
             m.buffs = [b for b in m.buffs if b.active]
@@ -1013,16 +2270,13 @@ class Game:
             # ---- detecting nearby traps ----
             for t in [
                 t
-                for t in Game.items.values()
-                if t.z == hero.z
-                and isinstance(t, Trap)
-                and t.x == hero.x + nx
-                and t.y == hero.y + ny
+                for t in Game.items_at(hero.z, hero.x + nx, hero.y + ny)
+                if isinstance(t, Trap)
             ]:
                 if not t.detected:
                     if t.calculate_detect():
                         t.detected = True
-                        t.effect_detected()
+                        Game.present(t.effect_detected)
         # ------- checking of standing south of a terminal -----
         if hero.y > 0:
             north = Game.dungeon[hero.z][hero.y - 1][hero.x]
@@ -1042,7 +2296,7 @@ class Game:
         # ------ trampolin ? ------
         t = Game.dungeon[hero.z][hero.y + dy][hero.x + dx]
         if isinstance(t, Trampolin):
-            Flytext(tx=hero.x, ty=hero.y, text="Juuuuuump!")
+            Game.present(Flytext, tx=hero.x, ty=hero.y, text="Juuuuuump!")
 
         # ------------- iterating over (damage) effects at player position ------
         # for e in [e for e in Game.effects.values() if e.tx == hero.x and e.ty == hero.y]:
@@ -1058,24 +2312,20 @@ class Game:
         # ]#
 
         # ------------ iterate over items at player position --------------------
-        for i in [
-            i
-            for i in Game.items.values()
-            if i.z == hero.z and i.x == hero.x and i.y == hero.y and not i.backpack
-        ]:
+        for i in Game.items_at(hero.z, hero.x, hero.y):
             #  ----------------- trap ------------------------
             if isinstance(i, Trap):
                 damage = i.calculate_damage()
                 hero.hp -= damage
                 i.detected = True
                 text.append(f"You trigger a trap and loose {damage} hp.")
-                i.effect_trigger(
-                    damage
+                Game.present(
+                    i.effect_trigger, damage
                 )  # skull and bones effect from trap, -hp flysprite
                 # delete trap?
                 if i.calculate_destroy():
                     text.append("the trap is destroyed")
-                    del Game.items[i.number]
+                    i.remove()
                 else:
                     text.append("the trap is still active! Move away from here!")
 
@@ -1084,79 +2334,45 @@ class Game:
                 text.append(f"you pick up: {type(i).__name__}")
                 i.backpack = True
                 ## create Bubble effect here
-                i.pickupeffect()
+                Game.present(i.pickupeffect)
 
         # move the Monsters (and let monsters shoot at player)
-        for m in [
-            m
-            for m in Game.zoo.values()
-            if m.number != hero.number and m.z == hero.z and m.hp > 0
-        ]:
-            print("dxm..", m)
+        Game.activate_chunks()
+        self.wake_monsters()
+        for m in self.due_monsters():
             dxm, dym = m.ai()
             text.extend(self.move(m, dxm, dym))
 
         # ---- calculate if player suffer from monster shooting ----
         # ------------- iterating over (damage) effects at player position ------
-        for e in [
-            e for e in Game.effects.values() if e.tx == hero.x and e.ty == hero.y
-        ]:
+        for e in Game.effects_at(hero.x, hero.y):
             text.append(e.make_damage(Game.player))
             # damage = e.damage
             # text.append(f"You suffer {damage} {e.__class__.__name__} damage")
             # e.text_effect(damage)
             # hero.hp -= e.damage
         # --- give player xp for dead monsters ----
-        for m in [m for m in Game.zoo.values() if m.hp <= 0 and m.number != hero.number]:
+        # (wherever they died: an arrow can hit a monster far away, see Monster.hp)
+        dead = [m for m in Game.casualties if Game.zoo.get(m.number) is m]  # not removed with its level yet
+        Game.casualties = []
+        for m in [m for m in dead if m.number != hero.number]:
             hero.xp += m.xp_gain
         hero.check_xp()
 
 
         # cleanup code, remove dead monsters:
-        for m in [m for m in Game.zoo.values() if m.hp <= 0]:
+        for m in dead:
             if m.number == hero.number:
                 # draw(hero.z)  # one last time draw the dungeon
                 # c.print("You are dead")
                 text.append("You are dead")
                 Game.running = False
                 return text
-            del Game.zoo[m.number]
+            m.remove()
 
         # ------- burning oil -------
-        # create flames from burning oil
-        for y, line in enumerate(Game.dungeon[hero.z]):
-            for x, t in enumerate(line):
-                if isinstance(t, Oil) and t.burning:
-                    Fire(tx=x, ty=y, max_age=1)
-
-        # spread fire to other oil
-        for y, line in enumerate(Game.dungeon[hero.z]):
-            for x, t in enumerate(line):
-                if isinstance(t, Oil) and t.burning:
-                    for dx, dy in [
-                        (0, -1),
-                        (1, -1),
-                        (1, 0),
-                        (1, 1),
-                        (0, 1),
-                        (-1, 1),
-                        (-1, 0),
-                        (-1, -1),
-                    ]:
-                        try:
-                            t2 = Game.dungeon[hero.z][y + dy][x + dx]
-                        except IndexError:
-                            continue
-                        if isinstance(t2, Oil) and not t2.burning:
-                            t2.burning = True
-
-        # ---- Fire on Oil makes Oil burning
-        for e in Game.effects.values():
-            if isinstance(e, Fire):
-                t = Game.dungeon[hero.z][e.ty][e.tx]
-                if isinstance(t, Oil) and not t.burning:
-                    if random.random() < 0.2:  # chance to ignite
-                        t.burning = True
+        self.spread_fire(Game.dungeon[hero.z])
+        Game.dungeon[hero.z].evict_chunks(hero.x, hero.y)
 
         # ---------------------------
         self.calculate_fov()
@@ -1178,24 +2394,58 @@ class Effect:
     Effects interchange with each other: (fire+Water->Steam)
     Effects influence Field of View (fov) -> Smoke blocks sight, Wind blocks shooting etc.
     Effects may genearte a Sprite with the same effectnumber for reference
+
+    Effects are slotted and pooled: destroyed effects are not thrown away but kept in
+    Effect.pool and re-used by the next effect of the same class, see __new__ and release.
+    Do not keep references to an effect after it is destroyed.
+    Subclasses must define __slots__ = () to stay slotted
     """
 
+    __slots__ = (
+        "number",
+        "tx",
+        "ty",
+        "px",
+        "py",
+        "fov",
+        "dx",
+        "dy",
+        "age",
+        "seconds",
+        "max_age",
+        "destroy",
+        "kill_on_contact_with_wall",
+    )
+    pool = {}  # {Effect subclass: [destroyed effects, ready for re-use]}
+    pool_size = 8192  # max. number of pooled effects per class
     pictures = []  # for animation
     anim_cycle = 6  # how many pictures per second the animation should display
     wobble = False  # if effect dances around center of tile each frame some pixel. can be False or Tuple(x,y)
     damage = 0  # fixed damage, overwrite by child classes
+    light_radius = 0  # if > 0 then the effect itself emits light (flame, fireball etc), see Game.calculate_light
 
     @classmethod
     def create_pictures(cls):
         pass
 
+    def __new__(cls, *args, **kwargs):
+        free = Effect.pool.get(cls)
+        if free:
+            return free.pop()  # re-use a destroyed effect, __init__ sets all attributes again
+        return super().__new__(cls)
+
+    def release(self):
+        """put a destroyed effect into the pool of its class, see __new__"""
+        self.fov = False  # do not paint it any more
+        free = Effect.pool.setdefault(type(self), [])
+        if len(free) < Effect.pool_size:
+            free.append(self)
+
     def __init__(self, tx, ty, age=0, max_age=None, dx=0, dy=0):
         self.number = Game.effectnumber
         Game.effectnumber += 1
         Game.effects[self.number] = self
-        self.background = pygame.Surface(
-            (Viewer.gridsize[0], Viewer.gridsize[1])
-        )  # background rect from Viewer
+        Game.effect_index.add((tx, ty), self)
         self.tx = tx  # tile x
         self.ty = ty  # tile y
         self.px, self.py = 0, 0  # pixel coordinate of topleft corner
@@ -1213,19 +2463,19 @@ class Effect:
         # self.char = "?"
         # self.text = "unknown effect"
         # self.fgcolor = (25,25,25)
-        self.light_radius = (
-            0  # if > 0 then the effect itself emits light (flame, fireball etc)
-        )
 
     def make_damage(self, victim):
         for b in victim.buffs:
             if isinstance(b, Shield):
                 b.strenght -= 1
                 if b.strenght == 0:
-                    Flytext(tx=victim.x, ty=victim.y, text="Shield destroyed!")
+                    Game.present(
+                        Flytext, tx=victim.x, ty=victim.y, text="Shield destroyed!"
+                    )
                 return f"{self.__class__.__name__} damage negated by shield buff"
         victim.hp -= self.damage
-        Flytext(
+        Game.present(
+            Flytext,
             tx=victim.x,
             ty=victim.y,
             text=f"{self.__class__.__name__} dmg: -{self.damage}hp",
@@ -1238,8 +2488,10 @@ class Effect:
         # if self.max_age is not None and self.age > self.max_age:
         if self.max_age is not None and self.age > self.max_age:
             self.destroy = True
+        old_tile = (self.tx, self.ty)
         self.tx += self.dx
         self.ty += self.dy
+        Game.effect_index.move(old_tile, (self.tx, self.ty), self)
         # kill when effects leave level limit
         # print("level:", len(Game.dungeon[Game.player.z][0]), "x", len(Game.dungeon[Game.player.z]) )
         if self.tx < 0 or self.tx >= len(Game.dungeon[Game.player.z][0]):
@@ -1270,7 +2522,8 @@ class Effect:
         return self.pictures[i]
 
     def text_effect(self, damage):
-        Flytext(
+        Game.present(
+            Flytext,
             tx=self.tx,
             ty=self.ty,
             text=f"{self.__class__.__name__}: -{damage} hp",
@@ -1280,6 +2533,7 @@ class Effect:
 
 
 class Fire(Effect):
+    __slots__ = ()
     pictures = []
     char = "\U0001F525"  # Flames "*"
     # char = "\u2668" # hot springs
@@ -1287,6 +2541,11 @@ class Fire(Effect):
     # text = "Fire"
     fgcolor = (255, 0, 0)  # for panelinfo
     damage = 4
+    light_radius = 2
+
+    def __init__(self, tx, ty, age=0, max_age=None, dx=0, dy=0):
+        super().__init__(tx, ty, age, max_age, dx, dy)
+        Game.new_fires[self.number] = self  # may set oil on fire, see Game.spread_fire
 
     @classmethod
     def create_pictures(cls):
@@ -1298,6 +2557,7 @@ class Fire(Effect):
 
 
 class Water(Effect):
+    __slots__ = ()
     pictures = []
     wobble = (1, 1)
     char = "\U0001F30A"  # "#"\u2248"  # double wave instead of "~"
@@ -1315,6 +2575,7 @@ class Water(Effect):
 
 
 class Ice(Effect):
+    __slots__ = ()
     pictures = []
     wobble = (1, 1)
     char = "\u2744"  # "#"\u2248"  # double wave instead of "~"
@@ -1333,6 +2594,7 @@ class Ice(Effect):
 
 
 class Flash(Effect):
+    __slots__ = ()
     pictures = []  # necessary!
     char = "\u26A1"
     fgcolor = (0, 200, 200)  # cyan
@@ -1352,10 +2614,13 @@ class Flash(Effect):
 
 class Structure:
     """a structrue can not move and can not be picked up
-    structures do not have a x,y,z coordinate because they
-    exist only in the dungeon array. the position inside
-    the array equals to x,y. See Wall class docstring for detecting neighbors
+    structures do not have a z coordinate because they
+    exist only in the dungeon array. The Level sets .level, .x and .y
+    when the structure is placed, because fov, explored and bgcolor are
+    stored in the numpy arrays of the Level. See Wall class docstring for detecting neighbors
     expcets create_pictures to be called with list of neighboring tiles as arguments
+    The class attributes (block_sight, radarcolor...) are the type table for each kind of tile.
+    After changing block_sight, block_movement or block_shooting of a single tile, call .refresh()
     """
 
     fgcolor = (0, 150, 0)
@@ -1363,21 +2628,86 @@ class Structure:
     block_movement = False
     block_shooting = False
     nesw_tile = None  # if this is a char, fill self.nesw with True for north, east, south, west neigbors
-    exploredpic = None  # will be overwritten by create_pictures
-    fovpic = None  # will be overwritten by create_pictures
+    picture_table = {}  # {(class, char, fontsize, mono): (exploredpic, fovpic)} shared by all tiles
+    picture_key = None  # key into Structure.picture_table, set by create_pictures
     char = "?"  # simple char to use for rendering if nothing else is given in create_pictures
+    radarcolor = (255, 255, 0)  # alarm for unknown tile
+    code = 0  # tile type code in Level.kind, set by __init_subclass__
+    state_attributes = ()  # instance attributes that survive Game.compact_level (doors: open/closed...)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.code = len(Level.kinds)
+        Level.kinds.append(cls)
 
     def __init__(self):
-        self.explored = False  # stay visible on map, but with fog of war
-        self.fov = False  # currently in field of view of player?
+        self.level = None  # set by Level.bind
+        self.x = 0
+        self.y = 0
         # self.char = None  # for textual representation btw for make_text(char)
         # self.nesw = nesw  # neighboring tiles of the same structure, . tuple of 4 boools: north, east, south, west
 
+    # ------- views into the numpy arrays of the level ------
+    @property
+    def explored(self):
+        """stay visible on map, but with fog of war"""
+        return bool(self.level.explored[self.y, self.x])
+
+    @explored.setter
+    def explored(self, value):
+        self.level.explored[self.y, self.x] = value
+        self.level.mark_changed(self.y, self.x)
+
+    @property
+    def fov(self):
+        """currently in field of view of player?"""
+        return bool(self.level.fov[self.y, self.x])
+
+    @fov.setter
+    def fov(self, value):
+        self.level.fov[self.y, self.x] = value
+
+    @property
+    def bgcolor(self):
+        g = int(self.level.light[self.y, self.x])
+        return (g, g, g)
+
+    @bgcolor.setter
+    def bgcolor(self, color):
+        self.level.light[self.y, self.x] = color[0]
+
+    def refresh(self):
+        """copy block_sight, block_movement and block_shooting into the numpy masks of the level"""
+        if self.level is None:
+            return
+        if self.level.block_sight[self.y, self.x] != self.block_sight:
+            Game.opacity_changed()
+        self.level.bind(self.x, self.y, self)
+
+    @property
+    def exploredpic(self):
+        """picture for explored tiles outside of field of view, None before create_pictures"""
+        pictures = Structure.picture_table.get(self.picture_key)
+        return pictures[0] if pictures else None
+
+    @property
+    def fovpic(self):
+        """picture for tiles in field of view, None before create_pictures"""
+        pictures = Structure.picture_table.get(self.picture_key)
+        return pictures[1] if pictures else None
+
     def create_pictures(self, neighborlist=None, fontsize=48, mono=False):
-        self.exploredpic = make_text(
-            self.char, Viewer.explored_fgcolor, fontsize=fontsize, mono=mono
-        )
-        self.fovpic = make_text(self.char, self.fgcolor, fontsize=fontsize, mono=mono)
+        """the pictures are flyweights: rendered once for each class, char and fontsize and
+        shared by all tiles in Structure.picture_table. The char of walls, doors and glass
+        depends on the neighboring tiles, so the char stands for the neighbor mask"""
+        if Game.headless:
+            return  # no fonts without Viewer. Subclasses still calculate char, orientation etc.
+        self.picture_key = (type(self), self.char, fontsize, mono)
+        if self.picture_key not in Structure.picture_table:
+            Structure.picture_table[self.picture_key] = (
+                make_text(self.char, Viewer.explored_fgcolor, fontsize=fontsize, mono=mono),
+                make_text(self.char, self.fgcolor, fontsize=fontsize, mono=mono),
+            )
 
 
 class Wall(Structure):
@@ -1393,6 +2723,7 @@ class Wall(Structure):
     block_sight = True
     block_movement = True
     block_shooting = True
+    radarcolor = (0, 128, 0)  # mid green
     char = "#"
     # nesw_tile = "#"  # wall
     # exploredpictures = {}
@@ -1431,6 +2762,7 @@ class Wall(Structure):
 
 class Floor(Structure):
     char = " "
+    radarcolor = (50, 50, 50)
 
 
 class Oil(Structure):
@@ -1440,9 +2772,16 @@ class Oil(Structure):
     block_movement = False
     block_shooting = False
 
-    def __init__(self):
-        super().__init__()
-        self.burning = False
+    @property
+    def burning(self):
+        return self.level is not None and bool(self.level.burning[self.y, self.x])
+
+    @burning.setter
+    def burning(self, value):
+        if value and not self.burning:
+            self.level.ignite(self.y, self.x)
+        elif not value:
+            self.level.burning[self.y, self.x] = False
 
 
 class Trampolin(Structure):
@@ -1463,9 +2802,11 @@ class World(Structure):
         for d in [
             d for d in Game.items.values() if isinstance(d, Download) and d.backpack
         ]:
-            del Game.items[d.number]  # delete downloads
+            d.remove()  # delete downloads
             Game.player.xp += 50
-            Flytext(tx=Game.player.x, ty=Game.player.y, text="*** upload ***")
+            Game.present(
+                Flytext, tx=Game.player.x, ty=Game.player.y, text="*** upload ***"
+            )
 
 
 class Terminal(Structure):
@@ -1474,6 +2815,7 @@ class Terminal(Structure):
     block_sight = True
     block_movement = True
     block_shooting = True
+    state_attributes = ("block_sight",)  # see effect_download
 
     def create_pictures(self, neighbors):
         super().create_pictures(fontsize=Viewer.fontsize)
@@ -1481,12 +2823,14 @@ class Terminal(Structure):
     def effect_download(self):
         # Game.player.downloads += 1
         self.block_sight = False
+        self.refresh()
         d = Download(Game.player.x, Game.player.y, Game.player.z)
         d.backpack = True
         zerostring = list("010101010101010101010")
         for t in range(0, -12, -1):
             random.shuffle(zerostring)
-            Flytext(
+            Game.present(
+                Flytext,
                 tx=Game.player.x,
                 ty=Game.player.y - 1,
                 text="".join(zerostring),
@@ -1508,7 +2852,9 @@ class Door(Structure):
 
     # USE font instead of freetype so that doors get not expanded (ugly)
     fgcolor = (140, 100, 0)
+    radarcolor = (0, 64, 0)
     nesw_tile = "#"  # wall. a door can only be between walls
+    state_attributes = ("closed", "locked", "block_sight", "block_movement", "block_shooting")
 
     def __init__(self):
         super().__init__()
@@ -1543,7 +2889,9 @@ class Door(Structure):
             self.horizontal = True
         else:
             raise ValueError("strange position of Door", list_of_neighbors)
-        if self.horizontal:
+        if not self.closed:
+            self.char = "."  # restored open door, see Game.restore_level
+        elif self.horizontal:
             self.char = "\u2500"  # ""-"
         elif self.vertical:
             self.char = "\u2502"  # "|"
@@ -1556,6 +2904,7 @@ class Door(Structure):
         self.block_movement = False
         self.block_shooting = False
         self.locked = False
+        self.refresh()
         super().create_pictures(fontsize=Viewer.fontsize)
 
     def close(self):
@@ -1568,6 +2917,7 @@ class Door(Structure):
             self.char = "\u2500"  # ""-"
         elif self.vertical:
             self.char = "\u2502"  # "|"
+        self.refresh()
         super().create_pictures(fontsize=Viewer.fontsize)
 
 
@@ -1609,11 +2959,13 @@ class Glass(Structure):
 
 class StairDown(Structure):
     fgcolor = (150, 50, 90)  # dark pink
+    radarcolor = (128, 0, 128)
     char = "\u21F2"  # "\u21A7"  # downwards arrow from bar
 
 
 class StairUp(Structure):
     fgcolor = (60, 200, 200)  # cyan
+    radarcolor = (0, 128, 128)
     char = "\u21F1"  # "# "\u21A5"  # upwards arrow from bar
 
 
@@ -1639,10 +2991,60 @@ class Item:
         self.number = Game.itemnumber
         Game.itemnumber += 1
         Game.items[self.number] = self
-        self.backpack = False  # carried in players backpack?
-        self.x = x  # if not carried by player
-        self.y = y
-        self.z = z
+        self._backpack = False  # carried in players backpack?
+        self._x = x  # if not carried by player
+        self._y = y
+        self._z = z
+        Game.item_index.add((z, x, y), self)
+
+    # ---- x, y, z and backpack are properties to keep Game.item_index up to date ----
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._relocate(value, self._y, self._z)
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._relocate(self._x, value, self._z)
+
+    @property
+    def z(self):
+        return self._z
+
+    @z.setter
+    def z(self, value):
+        self._relocate(self._x, self._y, value)
+
+    @property
+    def backpack(self):
+        return self._backpack
+
+    @backpack.setter
+    def backpack(self, value):
+        if value and not self._backpack:
+            Game.item_index.remove((self._z, self._x, self._y), self)
+        elif not value and self._backpack:
+            Game.item_index.add((self._z, self._x, self._y), self)
+        self._backpack = value
+
+    def _relocate(self, x, y, z):
+        """change position and update Game.item_index (items in backpack are not indexed)"""
+        if not self._backpack:
+            Game.item_index.move((self._z, self._x, self._y), (z, x, y), self)
+        self._x, self._y, self._z = x, y, z
+
+    def remove(self):
+        """destroy this item: delete it from Game.items and Game.item_index"""
+        if not self._backpack:
+            Game.item_index.remove((self._z, self._x, self._y), self)
+        del Game.items[self.number]
 
     def flytext_and_bubbles(self, ftext=None, number_of_bubbles=None):
         if ftext is None:
@@ -1710,6 +3112,11 @@ class Arrow(Item):
     char = "\u27B3"
     font = 1  # symbola
 
+    @staticmethod
+    def fly(start_tile, end_tile):
+        """flying arrow sprite from start_tile to end_tile"""
+        FlyingObject(start_tile=start_tile, end_tile=end_tile, picture=Arrow.pictures[0])
+
 
 class Trap(Item):
     pictures = []
@@ -1839,7 +3246,8 @@ class Buff:
         if self.hp_change is not None:
             m.hp += self.hp_change
             if self.hp_change != 0:
-                Flytext(
+                Game.present(
+                    Flytext,
                     tx=m.x,
                     ty=m.y,
                     fontsize=12,
@@ -1888,6 +3296,7 @@ class Monster:
     ai_dy = (0, 0, 0, 1, -1)
     p_hunting = 0.5  # probability to move towards player
     xp_gain = 15  # how much xp the player gains for killing this monster
+    speed = 100  # energy gained per turn, see Game.due_monsters and Game.action_energy
 
     @classmethod
     def create_pictures(cls):
@@ -1898,21 +3307,82 @@ class Monster:
         self.number = Game.monsternumber  # get unique monsternumber
         Game.monsternumber += 1  # increase global monsternumber
         Game.zoo[self.number] = self  # store monster into zoo
-        self.x = x
-        self.y = y
-        self.z = z
+        self._x = x
+        self._y = y
+        self._z = z
+        Game.zoo_index.add((z, x, y), self)
+        Game.zoo_chunks.add(self.chunk_key(), self)
+        self.due = None  # turn of the next action (or of waking up) in Game.schedule, None if not scheduled
+        self.dormant = True  # asleep until the player comes near or its timer runs out, see Game.wake and Game.activate_chunks
+        self.awake_until = 0  # turn until the monster stays awake, see Game.wake
         self.buffs = []
         self.hp = 10  # this MUST be an instance attribute because each monster has individual hp
         # self.fgcolor = (255,0,0)# "red"
         self.friendly = False  # friendly towards player?
         # self.char = "M"  # Monster
 
+    # ---- hp is a property to find dead monsters anywhere on the level, see Game.casualties ----
+    @property
+    def hp(self):
+        return self._hp
+
+    @hp.setter
+    def hp(self, value):
+        if value <= 0 < getattr(self, "_hp", 1):
+            Game.casualties.append(self)
+        self._hp = value
+
+    # ---- x, y, z are properties to keep Game.zoo_index up to date ----
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._relocate(value, self._y, self._z)
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._relocate(self._x, value, self._z)
+
+    @property
+    def z(self):
+        return self._z
+
+    @z.setter
+    def z(self, value):
+        self._relocate(self._x, self._y, value)
+
+    def _relocate(self, x, y, z):
+        """change position and update Game.zoo_index and Game.zoo_chunks"""
+        Game.zoo_index.move((self._z, self._x, self._y), (z, x, y), self)
+        old_chunk = self.chunk_key()
+        self._x, self._y, self._z = x, y, z
+        Game.zoo_chunks.move(old_chunk, self.chunk_key(), self)
+
+    def chunk_key(self):
+        """key (z, cx, cy) of the chunk of this monster in Game.zoo_chunks"""
+        return self._z, self._x // Level.chunk_size, self._y // Level.chunk_size
+
+    def remove(self):
+        """delete this monster from Game.zoo, Game.zoo_index and Game.zoo_chunks"""
+        Game.zoo_index.remove((self._z, self._x, self._y), self)
+        Game.zoo_chunks.remove(self.chunk_key(), self)
+        del Game.zoo[self.number]
+
     def ai(self):
         # hunt player or move around at random?
         if random.random() >= self.p_hunting:
-            print("ai not hunting", self)
             return random.choice(self.ai_dx), random.choice(self.ai_dy)
-        print("ai hunting", self)
+        # ---- follow the shortest path to the player ----
+        step = Game.path_step(self)
+        if step is not None:
+            return step
+        # ---- too far away for the distance map: move straight towards the player ----
         if Game.player.x == self.x:
             dx = 0
         elif Game.player.x < self.x:
@@ -1946,6 +3416,7 @@ class CrazyCat(Monster):
     char = "\U0001F638"
     p_hunting = 0.0
     xp_gain = 50
+    speed = 150  # cats are quick
 
     def __init__(self, x, y, z):
         super().__init__(x, y, z)
@@ -1978,6 +3449,7 @@ class Yeti(Monster):
     p_shooting = 0.1  # probabiltiy to shoot at player
     p_hunting = 0.4  # probability to move towards player
     xp_gain = 50
+    speed = 75  # yetis are slow
 
     def __init__(self, x, y, z):
         super().__init__(x, y, z)
@@ -1988,15 +3460,12 @@ class Yeti(Monster):
         if Game.dungeon[self.z][self.y][self.x].fov:  # visible?
             if random.random() < self.p_shooting:
                 # spit fire if line-of-shight for shooting is True (can shoot)
-                if calculate_line(
-                    (self.x, self.y),
-                    (Game.player.x, Game.player.y),
-                    Game.player.z,
-                    modus="shoot",
-                ):
-                    points = get_line((self.x, self.y), (Game.player.x, Game.player.y))
-                    for f in points[:6]:
-                        Ice(f[0], f[1], max_age=2)
+                points, blocked, met = trace_line(
+                    (self.x, self.y), (Game.player.x, Game.player.y), self.z
+                )
+                if blocked is None:
+                    for x, y in points[:6]:
+                        Ice(x, y, max_age=2)
 
         return super().ai()
 
@@ -2007,6 +3476,7 @@ class FireDragon(Monster):
     char = "\U0001F409"
     p_shooting = 0.2  # probabiltiy to shoot at player
     p_hunting = 0.6  # probability to move towards player
+    keep_distance = 3  # flee from player if closer than that (steps on the distance map)
     xp_gain = 80
 
     def __init__(self, x, y, z):
@@ -2021,18 +3491,22 @@ class FireDragon(Monster):
             if random.random() < self.p_shooting:
                 # print("Fire spit!...")
                 # spit fire if line-of-shight for shooting is True (can shoot)
-                if calculate_line(
-                    (self.x, self.y),
-                    (Game.player.x, Game.player.y),
-                    Game.player.z,
-                    modus="shoot",
-                ):
+                points, blocked, met = trace_line(
+                    (self.x, self.y), (Game.player.x, Game.player.y), self.z
+                )
+                if blocked is None:
                     # print("feuerspucke")
-                    points = get_line((self.x, self.y), (Game.player.x, Game.player.y))
-                    for f in points[:6]:
-                        Fire(f[0], f[1], max_age=1)
+                    for x, y in points[:6]:
+                        Fire(x, y, max_age=1)
         # else:
         # print("firedragon not in fov")
+        # ---- keep distance: walk uphill on the distance map ----
+        if self.z == Game.player.z:
+            distance = Game.distance(self.z, self.x, self.y)
+            if 0 <= distance < self.keep_distance:
+                step = Game.path_step(self, flee=True)
+                if step is not None and step != (0, 0):
+                    return step
         return super().ai()
 
 
@@ -2050,20 +3524,15 @@ class SkyDragon(Monster):
 
     def ai(self):
         # ---fire spitting---
-        print("flash ai is in use")
         if Game.dungeon[self.z][self.y][self.x]:  # visible?
             if random.random() < 0.1:
-                can_shoot = calculate_line(
-                    (self.x, self.y),
-                    (Game.player.x, Game.player.y),
-                    Game.player.z,
-                    modus="shoot",
+                points, blocked, met = trace_line(
+                    (self.x, self.y), (Game.player.x, Game.player.y), self.z
                 )
-                if can_shoot:
+                if blocked is None:
                     # print("feuerspucke")
-                    points = get_line((self.x, self.y), (Game.player.x, Game.player.y))
-                    for f in points[:10]:
-                        Flash(f[0], f[1], max_age=1)
+                    for x, y in points[:10]:
+                        Flash(x, y, max_age=1)
 
         return super().ai()
 
@@ -2084,17 +3553,13 @@ class WaterDragon(Monster):
         # ---water spitting---
         if Game.dungeon[self.z][self.y][self.x]:  # visible?
             if random.random() < 0.5:
-                can_shoot = calculate_line(
-                    (self.x, self.y),
-                    (Game.player.x, Game.player.y),
-                    Game.player.z,
-                    modus="shoot",
+                points, blocked, met = trace_line(
+                    (self.x, self.y), (Game.player.x, Game.player.y), self.z
                 )
-                if can_shoot:
+                if blocked is None:
                     # print("wasserspucke")
-                    points = get_line((self.x, self.y), (Game.player.x, Game.player.y))
-                    for f in points[:6]:
-                        Water(f[0], f[1], max_age=3)
+                    for x, y in points[:6]:
+                        Water(x, y, max_age=3)
         return super().ai()
 
 
@@ -2130,16 +3595,21 @@ class Player(Monster):
             self.level += 1
             #Flytext(tx=self.x, ty=self.y, text=f"reached lvl {self.level}")
             #Flytext(tx=self.x, ty=self.y, text="Level Up", fontsize=200, max_age=5)
-            Flytext(tx=self.x, ty=self.y, text="xxx", picture=Viewer.images["bow"])
+            Game.present(self.level_up_effect)
 
             self.xp_full +=   100 + self.level * 10
 
+    def level_up_effect(self):
+        Flytext(tx=self.x, ty=self.y, text="xxx", picture=Viewer.images["bow"])
+
     def update(self):
         """called once per game turn"""
         if self.shield:
             self.mana -= self.shield_upkeep
             if self.mana < 1:
-                Flytext(tx=self.x, ty=self.y, text="not enough mana for shield")
+                Game.present(
+                    Flytext, tx=self.x, ty=self.y, text="not enough mana for shield"
+                )
                 self.shield = False
         # --- mana regeneration ----
         self.mana += self.mana_regeneration
@@ -2156,7 +3626,6 @@ class Player(Monster):
     def arrow_hit(self, distance):
         p = 1 / distance * self.range_bonus
         roll = random.random()
-        print("to hit chance:", p, "roll:", roll)
         return roll < p
 
     def shoot_arrow(
@@ -2166,71 +3635,71 @@ class Player(Monster):
         check if player has an arrow"""
         # self shooting?
         if (target_tx, target_ty) == (self.x, self.y):
-            Flytext(tx=self.x, ty=self.y, text="don't shoot yourself")
+            Game.present(Flytext, tx=self.x, ty=self.y, text="don't shoot yourself")
             return
         arrows = [i for i in Game.items.values() if isinstance(i, Arrow) and i.backpack]
         if len(arrows) == 0:
             # if not arrows:
-            Flytext(tx=self.x, ty=self.y, text="No arrow!", fontsize=12)
+            Game.present(Flytext, tx=self.x, ty=self.y, text="No arrow!", fontsize=12)
             return
         # Flytext(tx=self.x, ty=self.y, text="arrow!", color=(222, 0, 0))
         # ---- shoot the actual arrow ---
         # -------- shoot blue circles into each square until cursor-------
         # hier weitermachen
-        points = get_line((self.x, self.y), (target_tx, target_ty))
+        points, blocked, met = trace_line(
+            (self.x, self.y), (target_tx, target_ty), self.z, "shoot", occupants=True
+        )
+        if blocked is not None:
+            Game.present(
+                Flytext,
+                tx=self.x,
+                ty=self.y,
+                text="No valid target tile",
+                fontsize=12,
+            )
+            return  # shooting not possible
         max_distance = (
             (self.x - points[-1][0]) ** 2 + (self.y - points[-1][1]) ** 2
         ) ** 0.5
         max_time = 1.0
-        for point in points[1:]:
-            ok = calculate_line((self.x, self.y), point, self.z, "shoot")
-            if not ok:
-                Flytext(tx=self.x, ty=self.y, text="No valid target tile", fontsize=12)
-                return  # shooting not possible
+        end_tile = points[-1]
+        hit_tiles = set()
+        # theoretically there should be only one monster at a given dungeon tile
+        for i, v in met:
+            if i in hit_tiles:
+                continue  # can hit only one victim per tile
+            point = points[i]
             distance = ((self.x - point[0]) ** 2 + (self.y - point[1]) ** 2) ** 0.5
             delay = distance / max_distance * max_time
-            # theoretically there should be only one monster at a given dungeon tile
-            victims = [
-                v
-                for v in Game.zoo.values()
-                if v.z == self.z and v.x == point[0] and v.y == point[1]
-            ]
-            for v in victims:
-                if self.arrow_hit(distance):
-                    damage = self.arrow_damage()
-                    v.hp -= damage
-                    Flytext(
-                        tx=v.x,
-                        ty=v.y,
-                        text=f"dmg: -{damage}hp",
-                        age=-delay,
-                        fontsize=12,
-                    )
-                    break  # can hit only one victim per tile
-                else:
-                    Flytext(tx=v.x, ty=v.y, text="miss", age=-delay, fontsize=12)
-                # for _ in range(10):
-                # px, py = self.tile_to_pixel((point[0], point[1]))
-                # p = pygame.math.Vector2(px, py)
-                # Bubble(pos=p, age=-0.5)
+            if self.arrow_hit(distance):
+                damage = self.arrow_damage()
+                v.hp -= damage
+                Game.present(
+                    Flytext,
+                    tx=v.x,
+                    ty=v.y,
+                    text=f"dmg: -{damage}hp",
+                    age=-delay,
+                    fontsize=12,
+                )
+                hit_tiles.add(i)
+                if not fly_through_victims:
+                    end_tile = point
+                    break  # stop flying
             else:
-                continue  # arrow has hit nothing, fly to next tile
-            # arrow has hit someone at this tile
-            if fly_through_victims:
-                continue  # fly through all victims in path
-            break  # stop flying
-
-            # ---- passed this tile ---
+                Game.present(
+                    Flytext, tx=v.x, ty=v.y, text="miss", age=-delay, fontsize=12
+                )
         # ----- fly arrow from player to point! because flight-path may be blocked
-        FlyingObject(start_tile=points[0], end_tile=point, picture=Arrow.pictures[0])
+        Game.present(Arrow.fly, start_tile=points[0], end_tile=end_tile)
+        Game.noise(self.z, end_tile[0], end_tile[1], 6)  # the arrow clatters where it lands
         # -------------drop arrow at end of flight path
         if random.random() < drop_at_end_chance:
             (arrows[0].x, arrows[0].y) = points[-1]
-            print("end drop:", (arrows[0].x, arrows[0].y), points[-1])
             arrows[0].backpack = False
         else:
             # ---- destroy arrow ----
-            del Game.items[arrows[0].number]
+            arrows[0].remove()
 
 
 class Viewer:
@@ -2240,13 +3709,17 @@ class Viewer:
     gridsize = (1, 1)
     panelwidth = 0
     logheight = 0
+    loglineheight = 24  # pixel per line of the message log
     hudheight = 0  # height of hud on top of screen, for displaying hitpoints etc
     fontsize = 0
+    wallfontsize = 0
     font = None
+    font2 = None
     monofont = None
     allgroup = None  # pygame sprite Group for all sprites
     explored_fgcolor = (0, 100, 0)
     explored_bgcolor = (10, 10, 10)
+    greys = [(g, g, g) for g in range(256)]  # background color for each light value of Level.light
     panelcolor = (128, 128, 64)
     buttons = []
     # tile coordinate of topleft corner of currently visible tile on screen
@@ -2259,9 +3732,16 @@ class Viewer:
         0,
         0,
     ]
+    visible_tiles_key = None  # player position, level size, midscreen, gridsize of toplefttile/bottomrighttile
     images = {}
     sounds = {}
     radardot = [1, 1]
+    pixels_pushed = 0  # number of pixels pushed to the display in the last frame, see paint_screen
+    radar_surfaces = {}  # {id(level): Surface with one pixel per tile}, see radar_surface
+    radar_colors = None  # numpy array: radarcolor for each tile type code
+    glyph_cache = SurfaceCache(32 * 1024 * 1024)  # surfaces rendered by make_text
+    text_cache = SurfaceCache(8 * 1024 * 1024)  # surfaces rendered by write / render_text
+    fonts = FontRegistry()  # font objects for make_text, write and Flytext
 
     # playergroup = None # pygame sprite Group only for players
 
@@ -2276,6 +3756,9 @@ class Viewer:
         wallfontsize=72,
         max_tiles_x=200,
         max_tiles_y=200,
+        log_capacity=1000,
+        log_file=None,
+        save_file="pipe_rogue.sav",
     ):
 
         Viewer.width = width
@@ -2302,8 +3785,8 @@ class Viewer:
         fontfile2 = os.path.join("data", "fonts", "NotoEmoji-Regular.ttf")
         # fontfile = os.path.join("data", "fonts", "NotoEmoji-Regular.ttf")
         Viewer.monofontfilename = os.path.join("data", "fonts", "FreeMonoBold.otf")
-        Viewer.font = pygame.freetype.Font(fontfile)  # Symbola605
-        Viewer.font2 = pygame.freetype.Font(fontfile2)  # NotoEmoji-Regular
+        Viewer.font = Viewer.fonts.get(fontfile)  # Symbola605
+        Viewer.font2 = Viewer.fonts.get(fontfile2)  # NotoEmoji-Regular
         # Viewer.monofont = pygame.freetype.Font(monofontfile)
         # Viewer.monofont = pygame.font.Font(monofontfile)
 
@@ -2335,7 +3818,17 @@ class Viewer:
         self.logscreen = pygame.Surface(
             (Viewer.width, Viewer.height - Viewer.logheight)
         )
-        self.loglines = []
+        self.loglines = MessageLog(log_capacity, log_file)
+        self.savefile = SaveFile(save_file)  # F5: save, F9: load
+        self.log_offset = 0  # number of lines scrolled back with PgUp
+        self.log_newest = None  # number of the message painted in the bottom line of self.logscreen
+        # ---- dirty rectangle rendering, see paint_screen ----
+        self.screen_backup = None  # static layers without sprites, created in the first frame
+        self.tile_signatures = {}  # {(x, y) topleft pixel of cell: signature of painted tile}
+        self.visible_effects = []  # effects in fov and on screen, set by paint_tiles
+        self.panelinfo_signature = None
+        self.dirty = []  # rects of self.screen that must be pushed to the display in this frame
+        self.sprite_rects = []  # rects painted by animations, sprites and overlays in the last frame
         self.prepare_sprites()
         # ------ need Game instance ----
         self.g = Game()
@@ -2419,40 +3912,65 @@ class Viewer:
         for sc in Buff.__subclasses__():
             sc.create_pictures()
 
+    def radar_surface(self, level):
+        """returns the radar surface of level: one pixel per tile, radarcolor of the tile type
+        or black if not explored. The surface is kept in Viewer.radar_surfaces and
+        only the pixels of tiles in level.changed are written again"""
+        if Viewer.radar_colors is None:
+            Viewer.radar_colors = Level.type_table("radarcolor")
+        surface = Viewer.radar_surfaces.get(id(level))
+        if surface is None or level.all_changed:
+            # ---- new level: paint all tiles at once ----
+            colors = Viewer.radar_colors[level.kind]
+            colors[~level.explored] = 0
+            surface = pygame.surfarray.make_surface(colors.transpose(1, 0, 2))
+            # forget the surfaces of compacted levels (see Game.compact_level)
+            living = {id(l) for l in Game.dungeon if l is not None}
+            for key in [key for key in Viewer.radar_surfaces if key not in living]:
+                del Viewer.radar_surfaces[key]
+            Viewer.radar_surfaces[id(level)] = surface
+            level.all_changed = False
+        elif level.changed:
+            pixels = pygame.surfarray.pixels3d(surface)  # [x, y, rgb], locks the surface
+            for ys, xs in level.changed:
+                colors = Viewer.radar_colors[level.kind[ys, xs]]
+                colors[~level.explored[ys, xs]] = 0
+                pixels[xs, ys] = colors
+            del pixels  # unlock
+        level.changed = []
+        return surface
+
     def make_radar(self):
+        """paint the radar: a scaled cut-out of the radar surface of the current level,
+        centered on the player, with the monsters in field of view on top"""
         self.radarscreen.fill((0, 0, 0))  # fill black
         hero = Game.player
+        level = Game.dungeon[hero.z]
         midx = self.midradar[0] - int(Viewer.radardot[0] // 2)
         midy = self.midradar[1] - int(Viewer.radardot[1] // 2)
-        for y, line in enumerate(Game.dungeon[hero.z]):
-            for x, tile in enumerate(Game.dungeon[hero.z][y]):
-                if not tile.explored:
-                    continue
-                elif isinstance(tile, Floor):
-                    color = (50, 50, 50)
-                elif isinstance(tile, Wall):
-                    color = (0, 128, 0)  # mid green
-                elif isinstance(tile, StairUp):
-                    color = (0, 128, 128)
-                elif isinstance(tile, StairDown):
-                    color = (128, 0, 128)
-                elif isinstance(tile, Door):
-                    color = (0, 64, 0)
-                else:
-                    color = (255, 255, 0)  # alarm for unknow tile
-                pygame.draw.rect(
-                    self.radarscreen,
-                    color,
-                    (
-                        midx - Viewer.radardot[0] * (-x + hero.x),
-                        midy - Viewer.radardot[1] * (-y + hero.y),
-                        Viewer.radardot[0],
-                        Viewer.radardot[1],
-                    ),
-                )
-        # -- monster
-        for m in Game.zoo.values():
-            if m.hp > 0 and m.z == hero.z and Game.dungeon[hero.z][m.y][m.x].fov:
+        dotx, doty = Viewer.radardot
+        # ---- only the part of the level that fits into the radarscreen ----
+        x1 = max(0, hero.x - midx // dotx - 1)
+        x2 = min(level.width, hero.x + (Viewer.panelwidth - midx) // dotx + 2)
+        y1 = max(0, hero.y - midy // doty - 1)
+        y2 = min(level.height, hero.y + (Viewer.panelwidth - midy) // doty + 2)
+        surface = self.radar_surface(level)
+        if x1 < x2 and y1 < y2:
+            dots = surface.subsurface((x1, y1, x2 - x1, y2 - y1))
+            if (dotx, doty) != (1, 1):
+                dots = pygame.transform.scale(dots, ((x2 - x1) * dotx, (y2 - y1) * doty))
+            self.radarscreen.blit(
+                dots, (midx - dotx * (hero.x - x1), midy - doty * (hero.y - y1))
+            )
+        # -- monster: only those inside the cut-out, found by chunk (see Game.monsters_around)
+        radius = max(
+            midx // dotx + 1,
+            (Viewer.panelwidth - midx) // dotx + 2,
+            midy // doty + 1,
+            (Viewer.panelwidth - midy) // doty + 2,
+        )
+        for m in Game.monsters_around(hero.z, hero.x, hero.y, radius):
+            if m.hp > 0 and level.fov[m.y, m.x]:
                 pygame.draw.rect(
                     self.radarscreen,
                     m.fgcolor,
@@ -2514,7 +4032,7 @@ class Viewer:
         # w = Viewer.panelwidth // 4
         for nr, b in enumerate(Viewer.buttons):
             pygame.draw.rect(
-                self.screen,
+                self.screen_backup,
                 b.bgcolor,
                 (
                     b.x1,
@@ -2524,7 +4042,7 @@ class Viewer:
                 ),
             )
             #print("button", nr, b.x1, b.y1, b.width, b.height)
-            self.screen.blit(b.image, (b.x1, b.y1))
+            self.screen_backup.blit(b.image, (b.x1, b.y1))
 
         # for r in range(4):
         #    pygame.draw.rect(self.panelscreen, (0,0,0), (w*r,y, w,40 ),2)
@@ -2698,24 +4216,57 @@ class Viewer:
         # pygame.draw.rect(self.panelscreen, (222, 0, 222), (0, y, Viewer.panelwidth, 40))
 
     def make_log(self):
-        # self.logscreen = pygame.Surface((Viewer.width, Viewer.height - Viewer.logheight))
-        self.logscreen.fill((64, 64, 64))
-        for y in range(-1, -16, -1):  # write the last 15 lines
-            try:
-                line = self.loglines[y]
-            except IndexError:
+        """paint the visible lines of the message log into self.logscreen, newest line at the bottom.
+        self.log_offset lines are skipped at the bottom (PgUp / PgDown).
+        If only new messages have arrived, the painted lines are scrolled up and only the
+        new lines are painted. Each line is painted into its own strip of Viewer.loglineheight pixel,
+        the text surfaces are cached by render_text"""
+        lineheight = Viewer.loglineheight
+        visible = Viewer.logheight // lineheight + 1  # the top line may be cut
+        newest = self.loglines.count - self.log_offset
+        if self.log_newest is not None and 0 <= newest - self.log_newest < visible:
+            new_lines = newest - self.log_newest
+            self.logscreen.scroll(0, -new_lines * lineheight)
+        else:
+            new_lines = visible  # paint all
+        self.log_newest = newest
+        for k in range(new_lines):
+            strip = pygame.Rect(0, Viewer.logheight - (k + 1) * lineheight, Viewer.width, lineheight)
+            # fill() moves rects with negative y into the surface instead of cutting them
+            self.logscreen.fill((64, 64, 64), strip.clip(self.logscreen.get_rect()))
+            i = newest - k
+            line = self.loglines.get(i)
+            if line is None:
                 continue
-            i = len(self.loglines) + y + 1
+            self.logscreen.set_clip(strip)
             # c = i%5
             write(
                 self.logscreen,
-                f"{i}: {self.loglines[y]}",
+                f"{i}: {line}",
                 5,
-                Viewer.logheight - y * -24,
+                strip.top,
                 (0, 0, 50 + i % 5 * 40),
                 24,
                 origin="topleft",
             )
+            self.logscreen.set_clip(None)
+
+    def scroll_log(self, lines):
+        """scroll the log back (lines > 0, PgUp) or forward (lines < 0, PgDown).
+        Can not scroll before the oldest message in memory.
+        returns the pygame.Rect of the repainted log on self.screen_backup"""
+        oldest_offset = max(0, len(self.loglines) - 1)
+        self.log_offset = between(self.log_offset + lines, 0, oldest_offset)
+        return self.paint_log()
+
+    def paint_log(self):
+        """make the log and paint it into self.screen_backup, returns the pygame.Rect of the log"""
+        self.make_log()
+        return self.screen_backup.blit(
+            self.logscreen,
+            (0, Viewer.height - Viewer.logheight),
+            (0, 0, Viewer.width, Viewer.logheight),
+        )
 
     @staticmethod
     def tile_to_pixel(tile_coordinates, center=True):
@@ -2744,183 +4295,175 @@ class Viewer:
         else:  # calculate absolute position of tile
             dtpx += hero.x
             dtpy += hero.y
-            dtpx = between(dtpx, Viewer.toplefttile[0], Viewer.bottomrighttile[0])
-            dtpy = between(dtpy, Viewer.toplefttile[1], Viewer.bottomrighttile[1])
+            topleft, bottomright = Viewer.visible_tiles()
+            dtpx = between(dtpx, topleft[0], bottomright[0])
+            dtpy = between(dtpy, topleft[1], bottomright[1])
             return (dtpx, dtpy)
 
+    @staticmethod
+    def visible_tiles():
+        """returns tile coordinates (topleft, bottomright) of the tiles that are painted on screen,
+        clipped to the current level. A tile is painted if the center of the tile (see tile_to_pixel)
+        is inside the dungeon area of the screen.
+        Calculated from player position, midscreen and gridsize only when one of those changes,
+        the result is also stored in Viewer.toplefttile and Viewer.bottomrighttile"""
+        hero = Game.player
+        level = Game.dungeon[hero.z]
+        key = (hero.x, hero.y, level.width, level.height, Viewer.midscreen, Viewer.gridsize)
+        if key != Viewer.visible_tiles_key:
+            gw, gh = Viewer.gridsize
+            # center of tile, relative to midscreen
+            cx = gw // 2
+            cy = gh // 2
+            maxx = Viewer.width - Viewer.panelwidth - gw - Viewer.midscreen[0] - cx
+            maxy = (
+                Viewer.height - Viewer.logheight - Viewer.hudheight - gh - Viewer.midscreen[1] - cy
+            )
+            # smallest dx with midscreen + dx * gw + cx >= 0, biggest dx with ... <= maxx
+            Viewer.toplefttile = [
+                max(0, hero.x - (Viewer.midscreen[0] + cx) // gw),
+                max(0, hero.y - (Viewer.midscreen[1] + cy) // gh),
+            ]
+            Viewer.bottomrighttile = [
+                min(level.width - 1, hero.x + maxx // gw),
+                min(level.height - 1, hero.y + maxy // gh),
+            ]
+            Viewer.visible_tiles_key = key
+        return Viewer.toplefttile, Viewer.bottomrighttile
+
     def paint_tiles(self):
+        """paints the tiles of the current level into self.screen_backup.
+        Each cell on screen remembers a signature of what was painted there (tile, light,
+        pictures of structure, items, monsters and buffs). Only cells with a new signature
+        are painted again. returns a list of pygame.Rect of all cells that have changed"""
         # destroyed effects are removed in calculate_fov -> process_effects
-        for e in Game.effects.values():
+        for e in self.visible_effects:
             e.fov = False  # clear old fov information
+        self.visible_effects = []
         z = Game.player.z
         dungeon = Game.dungeon[z]
-        tiles_x = len(Game.dungeon[0][0])  # z y x
-        tiles_y = len(Game.dungeon[0])
+        canvas = self.screen_backup
         # exploredfg = Viewer.explored_fgcolor  # (0,100,0)
         exploredbg = Viewer.explored_bgcolor  # (10,10,10)
-        Viewer.toplefttile = [tiles_x, tiles_y]  # start with absurd values
-        Viewer.bottomrighttile = [-1, -1]
-        for ty, line in enumerate(dungeon):
-            for tx, tile in enumerate(line):
+        light = dungeon.light  # grey value for each tile in fov, see Game.calculate_light
+        greys = Viewer.greys
+        old_signatures = self.tile_signatures
+        self.tile_signatures = {}
+        changed = []
+        # ---- iterate only over the tiles that are visible on screen ----
+        (x1, y1), (x2, y2) = Viewer.visible_tiles()
+        for ty in range(y1, y2 + 1):
+            line = dungeon[ty]
+            for tx in range(x1, x2 + 1):
+                tile = line[tx]
                 # -------------- process each tile ----------------------
-                x, y = Viewer.tile_to_pixel((tx, ty))
-                if (
-                    y < 0
-                    or y
-                    > Viewer.height
-                    - Viewer.logheight
-                    - Viewer.hudheight
-                    - Viewer.gridsize[1]
-                ):
-                    break  # tile does not exist / is outside visible area -> continue with next ty
-                if x < 0 or x > Viewer.width - Viewer.panelwidth - Viewer.gridsize[0]:
-                    continue  # next tx
-                # update visible tiles on screen information -> shrink rect of visible tiles
-                Viewer.toplefttile[0] = min(tx, Viewer.toplefttile[0])
-                Viewer.bottomrighttile[0] = max(tx, Viewer.bottomrighttile[0])
-                Viewer.toplefttile[1] = min(ty, Viewer.toplefttile[1])
-                Viewer.bottomrighttile[1] = max(ty, Viewer.bottomrighttile[1])
-                # correction for center (necessary because drawing/blitting from topleft center)
-                x -= Viewer.gridsize[0] // 2
-                y -= Viewer.gridsize[1] // 2
-                # paint on tile on the pygame sreen surface
+                x, y = Viewer.tile_to_pixel((tx, ty), center=False)  # topleft corner
+                cell = pygame.Rect(x, y, Viewer.gridsize[0], Viewer.gridsize[1])
+                # paint on tile on the screen_backup surface
                 if not tile.fov:
                     # --------------- outside fov ----- not in players field of view
-                    if (
-                        tile.explored
-                    ):  # known from previous encounter. paint only structure
+                    explored = tile.explored
+                    signature = (tx, ty, False, explored, tile.exploredpic if explored else None)
+                    self.tile_signatures[(x, y)] = signature
+                    if old_signatures.get((x, y)) == signature:
+                        continue  # cell on screen is still correct
+                    changed.append(cell)
+                    if explored:  # known from previous encounter. paint only structure
                         pygame.draw.rect(
-                            self.screen,
-                            exploredbg,
-                            (x, y, Viewer.gridsize[0], Viewer.gridsize[1]),
+                            canvas, exploredbg, cell
                         )  # fill with exploredbackgroundcolor
                         pic = tile.exploredpic
                         if pic is not None:
-                            self.screen.blit(pic, (x, y))  # blit from topleft corner
+                            canvas.blit(pic, (x, y))  # blit from topleft corner
                     else:  # invisible, black on black
-                        pygame.draw.rect(
-                            self.screen,
-                            (0, 0, 0),
-                            (x, y, Viewer.gridsize[0], Viewer.gridsize[1]),
-                        )  # fill
-                else:
-                    # ---------------------------- inside fov ----- , --> tile.bgcolor for background
-                    # --------- from ground to sky -> top is always drawn over (and partly blocking) bottom
-                    #  ----- background color ----
-                    pygame.draw.rect(
-                        self.screen,
-                        tile.bgcolor,
-                        (x, y, Viewer.gridsize[0], Viewer.gridsize[1]),
-                    )
-                    # ------- structure --------
-                    pic = tile.fovpic
-                    ##print("structure:", tile, " pic=", pic, x, y)
-                    if pic is not None:
-                        self.screen.blit(pic, (x, y))  # blit from topleft corner
-                    # ------------- items (without traps) ----------
-                    items = [
-                        i
-                        for i in Game.items.values()
-                        if i.z == z
-                        and i.y == ty
-                        and i.x == tx
-                        and not i.backpack
-                        and not isinstance(i, Trap)
-                    ]
-                    # ---------- traps (detected) ---------------
-                    traps = [
-                        i
-                        for i in Game.items.values()
-                        if i.z == z
-                        and i.y == ty
-                        and i.x == tx
-                        and not i.backpack
-                        and isinstance(i, Trap)
-                        and i.detected
-                    ]
-                    items.extend(traps)
-                    # ---- paint items and detected traps ---
-                    itemcounter = len(items)
-                    if itemcounter > 1:
-                        # blit 'infinite' symbol if more than one items are at one tile
-                        char = make_text("\u221E", (255, 200, 50))  # infinity sign
-                        self.screen.blit(char, (x, y))  # blit from topleft corner
-                    elif itemcounter == 1:
-                        self.screen.blit(items[0].fovpicture(), (x, y))
-
-                    # --------  monster -------------
-                    monsters = [
-                        m
-                        for m in Game.zoo.values()
-                        if m.z == z and m.y == ty and m.x == tx and m.hp > 0
-                    ]
-                    # monstercounter = len(monsters)
-                    for m in monsters:
-                        self.screen.blit(m.fovpicture(), (x, y))
-                        # ------------- buffs ------------------
-                        # ----display up to 9 active effects in each corner of monster
-                        # start first buff in lower right corner, then move to left, than higher but right, etc
-                        for nr, b in enumerate(m.buffs):
-                            bx, by = 0, 0  # topleft corner of blit
-                            if nr > 8:
-                                print(
-                                    "buff overflow: i can only display 9 buffs at once"
-                                )
-                            if nr % 3 == 0:  # 0, 3, 6
-                                bx = Viewer.gridsize[0] // 3 * 2
-                            elif nr % 3 == 1:  # 1, 4, 7
-                                bx = Viewer.gridsize[0] // 3 * 1
-                            elif nr % 3 == 2:  # 2, 5, 8
-                                bx = 0  # Viewer.gridsize[0] // 3 * 0
-                            if nr // 3 == 0:  # 0 ,1 ,2
-                                by = Viewer.gridsize[1] // 3 * 2
-                            elif nr // 3 == 1:  # 3, 4 , 5
-                                by = Viewer.gridsize[1] // 3 * 1
-                            elif nr // 3 == 2:  # 6, 7 ,8
-                                by = 0  # Viewer.gridsize[1] // 3 * 0
-
-                            self.screen.blit(b.pictures[0], (x + bx, y + by))
-                    # ------------- effects --------------
-                    for e in [
-                        e
-                        for e in Game.effects.values()
-                        if e.tx == tx and e.ty == ty and e.age >= 0
-                    ]:
+                        pygame.draw.rect(canvas, (0, 0, 0), cell)  # fill
+                    continue
+                # ---------------------------- inside fov ----- , --> light map for background
+                # ------------- effects --------------
+                for e in Game.effects_at(tx, ty):
+                    if e.age >= 0:
                         e.fov = True
                         e.px, e.py = x, y
-
-                    # ----- seve effect srceenrect to background (otherwise effects have black background? )
-
-                    for e in [
-                        e
-                        for e in Game.effects.values()
-                        if e.tx == tx and e.ty == ty and e.age >= 0
-                    ]:
-                        # where to blit ( what to blit, (where on dest topleftxy), (rect-area of source to blit )
-                        e.background.blit(
-                            self.screen,
-                            (0, 0),
-                            (e.px, e.py, Viewer.gridsize[0], Viewer.gridsize[1]),
-                        )
-                    # ------------ grid --------------
-                    pygame.draw.rect(
-                        self.screen,
-                        (128, 128, 128),
-                        (x, y, Viewer.gridsize[0], Viewer.gridsize[1]),
-                        1,
-                    )
+                        self.visible_effects.append(e)
+                # ------------- items (without traps) ----------
+                here = Game.items_at(z, tx, ty)
+                items = [i for i in here if not isinstance(i, Trap)]
+                # ---------- traps (detected) ---------------
+                traps = [i for i in here if isinstance(i, Trap) and i.detected]
+                items.extend(traps)
+                itemcounter = len(items)
+                # --------  monster -------------
+                monsters = Game.monsters_at(z, tx, ty)
+                signature = (
+                    tx,
+                    ty,
+                    True,
+                    light[ty, tx],
+                    tile.fovpic,
+                    "many" if itemcounter > 1 else items[0].fovpicture() if items else None,
+                    tuple((m.fovpicture(), tuple(b.pictures[0] for b in m.buffs)) for m in monsters),
+                )
+                self.tile_signatures[(x, y)] = signature
+                if old_signatures.get((x, y)) == signature:
+                    continue  # cell on screen is still correct
+                changed.append(cell)
+                # --------- from ground to sky -> top is always drawn over (and partly blocking) bottom
+                #  ----- background color ----
+                pygame.draw.rect(canvas, greys[light[ty, tx]], cell)
+                # ------- structure --------
+                pic = tile.fovpic
+                if pic is not None:
+                    canvas.blit(pic, (x, y))  # blit from topleft corner
+                # ---- paint items and detected traps ---
+                if itemcounter > 1:
+                    # blit 'infinite' symbol if more than one items are at one tile
+                    char = make_text("\u221E", (255, 200, 50))  # infinity sign
+                    canvas.blit(char, (x, y))  # blit from topleft corner
+                elif itemcounter == 1:
+                    canvas.blit(items[0].fovpicture(), (x, y))
+                for m in monsters:
+                    canvas.blit(m.fovpicture(), (x, y))
+                    # ------------- buffs ------------------
+                    # ----display up to 9 active effects in each corner of monster
+                    # start first buff in lower right corner, then move to left, than higher but right, etc
+                    for nr, b in enumerate(m.buffs):
+                        bx, by = 0, 0  # topleft corner of blit
+                        if nr > 8:
+                            print("buff overflow: i can only display 9 buffs at once")
+                        if nr % 3 == 0:  # 0, 3, 6
+                            bx = Viewer.gridsize[0] // 3 * 2
+                        elif nr % 3 == 1:  # 1, 4, 7
+                            bx = Viewer.gridsize[0] // 3 * 1
+                        elif nr % 3 == 2:  # 2, 5, 8
+                            bx = 0  # Viewer.gridsize[0] // 3 * 0
+                        if nr // 3 == 0:  # 0 ,1 ,2
+                            by = Viewer.gridsize[1] // 3 * 2
+                        elif nr // 3 == 1:  # 3, 4 , 5
+                            by = Viewer.gridsize[1] // 3 * 1
+                        elif nr // 3 == 2:  # 6, 7 ,8
+                            by = 0  # Viewer.gridsize[1] // 3 * 0
+                        canvas.blit(b.pictures[0], (x + bx, y + by))
+                # ------------ grid --------------
+                pygame.draw.rect(canvas, (128, 128, 128), cell, 1)
+        # ---- cells that show no tile any more (edge of level): restore background image ----
+        for (x, y) in old_signatures.keys() - self.tile_signatures.keys():
+            cell = pygame.Rect(x, y, Viewer.gridsize[0], Viewer.gridsize[1])
+            canvas.blit(self.background, cell, cell)
+            changed.append(cell)
+        return changed
 
     def paint_animation(self, seconds):
         """update animated tiles (effects) between player turns
         all visible effects have .fov set to True (done by self.paint_tiles)
         and all visible effects have already .px and .py for topleft corner in pixel (also by self.paint_tiles)
         seconds is time passed since last frame (from Viewer.run)
+        the tile below the effect is restored from self.screen_backup at the start of the next frame,
+        returns a list of pygame.Rect painted on self.screen
         """
-        for e in [e for e in Game.effects.values() if e.fov]:
-            # blit first backup screen from last frame (without sprites/effects)
-            # self.screen.blit(self.screen_backup, (e.px, e.py), (0,0,Viewer.gridsize[0], Viewer.gridsize[1]))
-
-            self.screen.blit(e.background, (e.px, e.py))
+        rects = []
+        for e in self.visible_effects:
+            if not e.fov:
+                continue  # destroyed and re-used in the meantime
             # blit effect picture on top
             if e.wobble:  # e.wobble is either False or a xy tuple
                 wobble_x = random.randint(-e.wobble[0], e.wobble[0])
@@ -2928,17 +4471,27 @@ class Viewer:
             else:
                 wobble_x = 0
                 wobble_y = 0
-            self.screen.blit(e.fovpicture(seconds), (e.px + wobble_x, e.py + wobble_y))
+            rects.append(
+                self.screen.blit(
+                    e.fovpicture(seconds), (e.px + wobble_x, e.py + wobble_y)
+                )
+            )
+        return rects
 
     def panelinfo(self):
-        """overwrites a piece of the panel with info about the objects currently under the cursor"""
+        """overwrites a piece of the panel with info about the objects currently under the cursor
+        returns True if the panel was changed, False if cursor tile and turn are the same as before"""
         tx, ty = self.cursor.tx, self.cursor.ty
         # print("from cursor:", tx, ty)
         hero = Game.player
         try:
             tile = Game.dungeon[hero.z][ty][tx]
         except IndexError:
-            return
+            return False
+        signature = (tx, ty, hero.z, Game.turn_number, tile.fov, tile.explored)
+        if signature == self.panelinfo_signature:
+            return False
+        self.panelinfo_signature = signature
         items = []
         monsters = []
         effects = []
@@ -2959,30 +4512,13 @@ class Viewer:
                     text = "Structure: " + tile.__class__.__name__
         else:
             text = "Structure: " + tile.__class__.__name__
-            for e in [
-                e
-                for e in Game.effects.values()
-                if e.tx == tx and e.ty == ty and e.age >= 0
-            ]:
-                effects.append(e)
-            for i in [
+            effects = [e for e in Game.effects_at(tx, ty) if e.age >= 0]
+            items = [
                 i
-                for i in Game.items.values()
-                if (
-                    not i.backpack
-                    and i.z == hero.z
-                    and i.x == tx
-                    and i.y == ty
-                    and not (isinstance(i, Trap) and not i.detected)
-                )
-            ]:
-                items.append(i)
-            for m in [
-                m
-                for m in Game.zoo.values()
-                if m.hp > 0 and m.z == hero.z and m.x == tx and m.y == ty
-            ]:
-                monsters.append(m)
+                for i in Game.items_at(hero.z, tx, ty)
+                if not (isinstance(i, Trap) and not i.detected)
+            ]
+            monsters = Game.monsters_at(hero.z, tx, ty)
         # ---- print to panel
         y = 400
         pygame.draw.line(self.panelscreen, (0, 0, 0), (0, y), (Viewer.panelwidth, y), 3)
@@ -3015,57 +4551,84 @@ class Viewer:
                 (0, 0, 0),
                 font_size=14,
             )
+        return True
+
+    def consume_events(self):
+        """create the sprites (Flytext, Bubbles...) that the game rules have queued with Game.present"""
+        events, Game.events = Game.events, []
+        for func, args, kwargs in events:
+            func(*args, **kwargs)
 
     def paint_screen(self, panel_has_changed=False, dungeon_has_changed=False):
-        """called 60 times per second from Viewer.run"""
+        """called 60 times per second from Viewer.run
+        self.screen_backup holds the static layers (tiles, radar, panel, log, buttons),
+        self.screen the static layers plus animations, sprites and overlays.
+        Only rectangles that have changed are pushed with pygame.display.update:
+        changed cells and widgets of the static layers, and the areas covered by
+        animations, sprites and overlays in this and the previous frame.
+        The number of pushed pixels is stored in Viewer.pixels_pushed"""
         # -------------------------delete everything on screen--------------------------------------
         # pygame.display.set_caption(str(cursormode))
-        # repaint = True
+        screen_rect = self.screen.get_rect()
         while True:
             milliseconds = self.clock.tick(self.fps)  #
             seconds = milliseconds / 1000
             self.playtime += seconds
             # ---- calculate fps ----
-            fps_text = "pipe_roge ({}x{}) FPS: {:8.3}".format(
-                Viewer.width, Viewer.height, self.clock.get_fps()
+            fonts = Viewer.fonts.stats()
+            fps_text = "pipe_roge ({}x{}) FPS: {:8.3} pixels/frame: {} fonts: {} ({} KB)".format(
+                Viewer.width,
+                Viewer.height,
+                self.clock.get_fps(),
+                Viewer.pixels_pushed,
+                fonts["fonts"],
+                fonts["bytes"] // 1024,
             )
             # pygame.display.set_caption("pipe_rogue version:".format(version))
             pygame.display.set_caption(fps_text)
-            repaint = False
-            # or len(self.flytextgroup) > 0
-            if self.cursormode or len(self.flygroup) > 0 or len(self.fxgroup):
-                repaint = True
+            self.consume_events()
+            if self.screen_backup is None:
+                # ---- very first frame: everything is new ----
+                self.screen_backup = self.background.copy()
+                self.tile_signatures = {}
+                self.dirty.append(screen_rect)
+                dungeon_has_changed = panel_has_changed = True
+            # ---- remove animations, sprites and overlays of the last frame ----
+            self.dirty.extend(self.sprite_rects)
+            self.sprite_rects = []
+            # ---- copy areas changed by event handlers (radar, log) or removed sprites ----
+            for rect in self.dirty:
+                self.screen.blit(self.screen_backup, rect, rect)
+            # ---- static layers: paint changes into screen_backup, then copy them to screen ----
+            changed = []
             if dungeon_has_changed:
-                self.screen.blit(self.background, (0, 0))
-                self.paint_tiles()
-                self.make_radar()
-                self.make_panel()
-                self.make_log()
-                ##pygame.display.flip() # bad idea
-                self.screen.blit(
-                    self.radarscreen, (Viewer.width - Viewer.panelwidth, 0)
-                )
-                self.screen.blit(self.logscreen, (0, Viewer.height - Viewer.logheight))
-                self.screen_backup = self.screen.copy()
+                changed.extend(self.paint_tiles())
+                changed.append(self.paint_radar())
+                changed.append(self.paint_log())
                 # testing...
                 # for x, i in enumerate(Flash.pictures):
                 #    self.screen.blit(i, (x * Viewer.gridsize[0], 20))
                 #    #input("...")
-            if repaint:
-                self.screen.blit(self.screen_backup, (0, 0))
-
-            self.cursorgroup.clear(self.screen, self.screen_backup)
-            if panel_has_changed:
+            if panel_has_changed or dungeon_has_changed:
                 self.make_panel()
+                self.panelinfo_signature = None  # make_panel has overwritten the panelinfo
             # ---- update panel with help for tile on cursor -----
             # if not self.cursormode:
-            self.panelinfo()
-            # ---- blit panel ---
-            self.screen.blit(
-                self.panelscreen, (Viewer.width - Viewer.panelwidth, Viewer.panelwidth)
-            )
-            # ---- clear old effect, paint new effects ----
-            self.paint_animation(seconds)
+            if self.panelinfo() or panel_has_changed or dungeon_has_changed:
+                # ---- blit panel ---
+                changed.append(
+                    self.screen_backup.blit(
+                        self.panelscreen,
+                        (Viewer.width - Viewer.panelwidth, Viewer.panelwidth),
+                    )
+                )
+                self.paint_buttons()
+            for rect in changed:
+                self.screen.blit(self.screen_backup, rect, rect)
+            self.dirty.extend(changed)
+            panel_has_changed = dungeon_has_changed = False  # for the next loop
+            # ---- paint new effects ----
+            self.sprite_rects.extend(self.paint_animation(seconds))
             # ---- update -----------------
             self.allgroup.update(seconds)
             self.cursorgroup.update(seconds)
@@ -3078,14 +4641,17 @@ class Viewer:
                     s.rect.centery = -500
             self.visiblegroup.draw(self.screen)
             self.cursorgroup.draw(self.screen)
+            for group in (self.allgroup, self.cursorgroup):
+                self.sprite_rects.extend(s.rect.copy() for s in group)
             if self.cursormode:
                 # ... self.cursor.tx, self.cursor.ty
-                ok = calculate_line(
+                points, blocked, met = trace_line(
                     (Game.player.x, Game.player.y),
                     (self.cursor.tx, self.cursor.ty),
                     Game.player.z,
                     "shoot",
                 )
+                ok = blocked is None
                 if ok and (Game.player.x, Game.player.y) != (
                     self.cursor.tx,
                     self.cursor.ty,
@@ -3096,38 +4662,54 @@ class Viewer:
                         + (Game.player.y - self.cursor.ty) ** 2
                     ) ** 0.5
                     chance = Game.player.arrow_hit_chance(distance)
-                    write(
-                        self.screen,
-                        chance,
-                        pygame.mouse.get_pos()[0] - Viewer.gridsize[0] // 2,
-                        pygame.mouse.get_pos()[1] - 10,
-                        font_size=13,
-                        color=(128, 0, 128),
+                    self.sprite_rects.append(
+                        write(
+                            self.screen,
+                            chance,
+                            pygame.mouse.get_pos()[0] - Viewer.gridsize[0] // 2,
+                            pygame.mouse.get_pos()[1] - 10,
+                            font_size=13,
+                            color=(128, 0, 128),
+                        )
                     )
                 else:
                     image = Viewer.images["bow_no"]
-                self.screen.blit(image, pygame.mouse.get_pos())
+                self.sprite_rects.append(
+                    self.screen.blit(image, pygame.mouse.get_pos())
+                )
             # ------- button helptext ----
             for b in Viewer.buttons:
                 ##print(b.rect, pygame.mouse.get_pos())
                 if b.rect.collidepoint(pygame.mouse.get_pos()):
                     ##print("maus in rect1")
-
-                    write(
-                        self.screen,
-                        b.text,
-                        Viewer.width - Viewer.panelwidth,
-                        b.rect.bottom,
-                        font_size=16,
+                    self.sprite_rects.append(
+                        write(
+                            self.screen,
+                            b.text,
+                            Viewer.width - Viewer.panelwidth,
+                            b.rect.bottom,
+                            font_size=16,
+                        )
                     )
-            self.paint_buttons()
-            pygame.display.flip()
-            # repaint = False
+            # ---- push only the changed parts of the screen to the display ----
+            self.dirty.extend(self.sprite_rects)
+            rects = [r.clip(screen_rect) for r in self.dirty]
+            rects = [r for r in rects if r.width and r.height]
+            Viewer.pixels_pushed = sum(r.width * r.height for r in rects)
+            pygame.display.update(rects)
+            self.dirty = []
             if len(self.flygroup) > 0:
                 continue
             break
         return
 
+    def paint_radar(self):
+        """make the radar and paint it into self.screen_backup, returns the pygame.Rect of the radar"""
+        self.make_radar()
+        return self.screen_backup.blit(
+            self.radarscreen, (Viewer.width - Viewer.panelwidth, 0)
+        )
+
     def run(self):
         """The mainloop"""
         running = True
@@ -3136,7 +4718,6 @@ class Viewer:
         text = []
         self.cursormode = False
         selection = None
-        hero = Game.player
         # pygame.mouse.set_visible(False)
         oldleft, oldmiddle, oldright = False, False, False
 
@@ -3163,6 +4744,7 @@ class Viewer:
         # self.paint_screen(True, True) # force painting of screen
         # --------------------------- main loop --------------------------
         while running:
+            hero = Game.player  # not cached: loading a saved game (F9) creates a new player
             # -------- events ------
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -3198,22 +4780,39 @@ class Viewer:
                             self.cursormode = True
                             selection = None  # clear old selection
                             # self.cursor.visible=True
+                        if event.key == pygame.K_F5:
+                            start = time.perf_counter()
+                            size = self.savefile.save()
+                            milliseconds = (time.perf_counter() - start) * 1000
+                            self.loglines.append(
+                                f"game saved ({size} bytes in {milliseconds:.1f} ms)"
+                            )
+                            dungeon_has_changed = True  # repaint log
+                        if event.key == pygame.K_F9:
+                            if os.path.exists(self.savefile.filename):
+                                self.savefile.load(self.g)
+                                hero = Game.player
+                                self.visible_effects = []  # old effects are gone
+                                self.loglines.append("game loaded")
+                            else:
+                                self.loglines.append("no saved game found")
+                            dungeon_has_changed = True
+                        if event.key == pygame.K_PAGEUP:
+                            page = Viewer.logheight // Viewer.loglineheight
+                            self.dirty.append(self.scroll_log(page))
+                        if event.key == pygame.K_PAGEDOWN:
+                            page = Viewer.logheight // Viewer.loglineheight
+                            self.dirty.append(self.scroll_log(-page))
                         if event.key == pygame.K_PLUS:
                             Viewer.radardot = [
                                 min(Viewer.panelwidth // 4, i * 2)
                                 for i in Viewer.radardot
                             ]
-                            self.make_radar()
-                            self.screen.blit(
-                                self.radarscreen, (Viewer.width - Viewer.panelwidth, 0)
-                            )
+                            self.dirty.append(self.paint_radar())
                             # dungeon_has_changed = True
                         if event.key == pygame.K_MINUS:
                             Viewer.radardot = [max(1, i // 2) for i in Viewer.radardot]
-                            self.make_radar()
-                            self.screen.blit(
-                                self.radarscreen, (Viewer.width - Viewer.panelwidth, 0)
-                            )
+                            self.dirty.append(self.paint_radar())
                         if event.key == pygame.K_w:
                             dx, dy = 0, -1
                             self.loglines.extend(self.g.turn(0, -1))
@@ -3328,11 +4927,12 @@ class Viewer:
                 panel_has_changed = True
 
             self.paint_screen(panel_has_changed, dungeon_has_changed)
-            repaint = False
+            panel_has_changed = False
             dungeon_has_changed = False
             # -----------------------------------------------------
         pygame.mouse.set_visible(True)
         pygame.quit()
+        self.loglines.close()
         # try:
         #    sys.exit()
         # finally:
@@ -3389,25 +4989,26 @@ def pulse(age_in_seconds, min_value=1, max_value=6, values_per_second=1):
         return int(i) + min_value
 
 
-def get_line(start, end):
-    """Bresenham's Line Algorithm
-    Produces a list of tuples from start and end
+@functools.lru_cache(maxsize=4096)
+def line_offsets(dx, dy):
+    """Bresenham's Line Algorithm for a line from (0, 0) to (dx, dy)
     source: http://www.roguebasin.com/index.php?title=Bresenham%27s_Line_Algorithm#Python
     see also: https://en.wikipedia.org/wiki/Bresenham%27s_line_algorithm
 
-    #>>> points1 = get_line((0, 0), (3, 4))
-    # >>> points2 = get_line((3, 4), (0, 0))
-    #>>> assert(set(points1) == set(points2))
-    #>>> print points1
-    #[(0, 0), (1, 1), (1, 2), (2, 3), (3, 4)]
-    #>>> print points2
-    #[(3, 4), (2, 3), (1, 2), (1, 1), (0, 0)]
+    A line depends only on the offset between its endpoints, so the result is cached.
+    The returned tuple is shared by all callers: do not modify it, translate it at the point of use:
+    points = [(x1 + ox, y1 + oy) for ox, oy in line_offsets(x2 - x1, y2 - y1)]
+
+    >>> line_offsets(3, 4)
+    ((0, 0), (1, 1), (1, 2), (2, 3), (3, 4))
+    >>> line_offsets(-3, -4)
+    ((0, 0), (-1, -1), (-2, -2), (-2, -3), (-3, -4))
+
+    :param int dx: x offset of the end point
+    :param int dy: y offset of the end point
+    :return: tuple of (x, y) offsets, starting with (0, 0) and ending with (dx, dy)
     """
-    # Setup initial conditions
-    x1, y1 = start
-    x2, y2 = end
-    dx = x2 - x1
-    dy = y2 - y1
+    x1, y1, x2, y2 = 0, 0, dx, dy
 
     # Determine how steep the line is
     is_steep = abs(dy) > abs(dx)
@@ -3446,7 +5047,20 @@ def get_line(start, end):
     # Reverse the list if the coordinates were swapped
     if swapped:
         points.reverse()
-    return points
+    return tuple(points)
+
+
+def get_line(start, end):
+    """Bresenham's Line Algorithm
+    Produces a list of tuples from start and end, see line_offsets
+
+    >>> get_line((0, 0), (3, 4))
+    [(0, 0), (1, 1), (1, 2), (2, 3), (3, 4)]
+    >>> get_line((3, 4), (0, 0))
+    [(3, 4), (2, 3), (1, 2), (1, 1), (0, 0)]
+    """
+    x1, y1 = start
+    return [(x1 + ox, y1 + oy) for ox, oy in line_offsets(end[0] - x1, end[1] - y1)]
 
 
 def calculate_line(start, end, z, modus="all"):
@@ -3472,29 +5086,304 @@ def calculate_line(start, end, z, modus="all"):
     :return: Union(bool, (bool, bool, bool))
     """
     # print("calculating line in dungeon", z, "from", start, "to", end, "for", modus)
-    points = get_line(start, end)
-    # create copy
+    if modus != "all":
+        return trace_line(start, end, z, modus)[1] is None
+    x1, y1 = start
+    level = Game.dungeon[z]
     sight_ok = True
     shoot_ok = True
     move_ok = True
-    for point in points:
-        x, y = point[0], point[1]
-        tile = Game.dungeon[z][y][x]
-        if tile.block_sight:
-            if modus == "sight":
-                return False
+    for ox, oy in line_offsets(end[0] - x1, end[1] - y1):
+        x, y = x1 + ox, y1 + oy
+        if level.block_sight[y, x]:
             sight_ok = False
-        if tile.block_movement:
-            if modus == "move":
-                return False
+        if level.block_movement[y, x]:
             move_ok = False
-        if tile.block_shooting:
-            if modus == "shoot":
-                return False
+        if level.block_shooting[y, x]:
             shoot_ok = False
-    if modus == "all":
-        return sight_ok, move_ok, shoot_ok
-    return True  # all other modi would have returned False way before
+    return sight_ok, move_ok, shoot_ok
+
+
+def trace_line(start, end, z, modus="shoot", occupants=False):
+    """walks once along the line in Game.dungeon[z] from startpoint(x,y) to endpoint(x,y)
+    and stops at the first tile blocking sight, shooting or moving (see calculate_line).
+
+    Includes both endpoints. With occupants=True, all living monsters standing on the line
+    (behind the start tile, up to and including the blocking tile) are collected on the way.
+
+    :param (int,int) start: start tile (x,y)
+    :param (int,int) end:   end tile (x,y)
+    :param int z:    z coordinate for Game.dungeon
+    :param str modus: can be "sight", "shoot", "move"
+    :param bool occupants: collect the monsters on the line
+    :return: (points, blocked, met): points is the list of (x,y) tiles of the line,
+             blocked is the index in points of the first blocking tile or None if the line is free,
+             met is a list of (index, monster) sorted by index
+    """
+    x1, y1 = start
+    mask = getattr(Game.dungeon[z], "block_" + {"sight": "sight", "shoot": "shooting", "move": "movement"}[modus])
+    points = []
+    met = []
+    for i, (ox, oy) in enumerate(line_offsets(end[0] - x1, end[1] - y1)):
+        x, y = x1 + ox, y1 + oy
+        points.append((x, y))
+        if occupants and i > 0:
+            met.extend((i, m) for m in Game.monsters_at(z, x, y))
+        if mask[y, x]:
+            return points, i, met
+    return points, None, met
+
+
+def compile_level(raw_level):
+    """translates a raw level (a multi-line text made up of chars according to dict 'legend')
+    into tile codes and a spawn table, without creating any Structure, Monster or Item.
+    Monsters (including the player) and items stand on a Floor tile.
+    Works on all chars at once: each different char is looked up only once in legend
+
+    :param str raw_level: a multi-lined text, all lines (longer than 1 char) must have the same length
+    :return: (kind, spawns): numpy array [y, x] uint8 of tile codes (see Level.kinds),
+             numpy array [n, 3] int32 of (code point of char, x, y) for each Monster and Item
+    """
+    lines = [line for line in raw_level.splitlines() if len(line) > 1]
+    width = len(lines[0])
+    if any(len(line) != width for line in lines):
+        raise ValueError("all lines of a level must have the same length")
+    chars = np.frombuffer("".join(lines).encode("utf-32-le"), dtype=np.uint32)
+    distinct, inverse = np.unique(chars, return_inverse=True)
+    codes = np.zeros(len(distinct), dtype=np.uint8)
+    spawning = np.zeros(len(distinct), dtype=bool)
+    for i, char in enumerate(distinct.tolist()):
+        myclass = legend.get(chr(char))  # legend is a top-level variable
+        if myclass is None:
+            raise ValueError(f"char {chr(char)!r} of level is not in legend")
+        if issubclass(myclass, (Monster, Item)):
+            codes[i] = Floor.code
+            spawning[i] = True
+        else:
+            codes[i] = myclass.code
+    inverse = inverse.reshape(len(lines), width)
+    kind = codes[inverse]
+    ys, xs = np.nonzero(spawning[inverse])  # row by row, like reading the text
+    spawns = np.stack((chars.reshape(len(lines), width)[ys, xs], xs, ys), axis=1).astype(np.int32)
+    return kind, spawns
+
+
+# header of a compiled level file: magic, format version, number of Level.kinds,
+# sha256 of source and legend, height, width, number of spawns. padded to 64 bytes
+level_header = struct.Struct("<4sHH32sIII")
+level_header_size = 64
+level_magic = b"PRLV"
+level_version = 1
+
+
+def read_level(filename):
+    """returns the compiled level (kind, spawns) of a level text file, see compile_level.
+    The first call compiles the text file and writes the result next to it (same name, ending .lvl).
+    Later calls map that file into memory (mmap) without copying, as long as the hash of the text
+    file (and of legend and Level.kinds) matches the hash stored in the compiled file"""
+    with open(filename, "rb") as f:
+        source = f.read()
+    signature = "".join(f"{char}={c.__name__};" for char, c in legend.items())
+    signature += ",".join(k.__name__ for k in Level.kinds)
+    digest = hashlib.sha256(source + signature.encode("utf-8")).digest()
+    compiled = os.path.splitext(filename)[0] + ".lvl"
+    try:
+        with open(compiled, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        data = None  # not compiled yet (or empty file)
+    if data is not None and len(data) >= level_header_size:
+        magic, version, kinds, stored, height, width, number = level_header.unpack_from(data)
+        size = level_header_size + number * 12 + height * width
+        if (magic, version, kinds, stored) == (level_magic, level_version, len(Level.kinds), digest):
+            if len(data) == size:
+                spawns = np.frombuffer(data, np.int32, number * 3, level_header_size)
+                kind = np.frombuffer(data, np.uint8, height * width, level_header_size + number * 12)
+                return kind.reshape(height, width), spawns.reshape(number, 3)
+    if data is not None:
+        data.close()
+    # ---- (re)compile the text file ----
+    kind, spawns = compile_level(source.decode("utf-8"))
+    header = level_header.pack(
+        level_magic, level_version, len(Level.kinds), digest, *kind.shape, len(spawns)
+    )
+    try:
+        with open(compiled + ".tmp", "wb") as f:
+            f.write(header.ljust(level_header_size, b"\0"))
+            f.write(spawns.tobytes())
+            f.write(kind.tobytes())
+        os.replace(compiled + ".tmp", compiled)
+    except OSError:
+        pass  # read-only folder: compile again next time
+    return kind, spawns
+
+
+def generate_level(
+    style="rooms",
+    width=None,
+    height=None,
+    seed=None,
+    monsters=0.005,
+    items=0.005,
+    player=False,
+):
+    """procedural dungeon level generator. Returns a compiled level (kind, spawns) like
+    compile_level, see Game.create_level. The same arguments (and seed) always give the same level.
+    All floor tiles are connected, the level is surrounded by walls. Monsters and items are
+    chosen at random from legend, one StairUp and one StairDown are placed on floor tiles
+
+    :param str style: "rooms" (rooms and corridors), "bsp" (binary space partitioning) or "caves"
+    :param int width: number of tiles in x direction. None for Game.max_tiles_x
+    :param int height: number of tiles in y direction. None for Game.max_tiles_y
+    :param seed: seed for the random generator (numpy), None for a random level
+    :param float monsters: chance for each floor tile to get a monster
+    :param float items: chance for each floor tile to get an item
+    :param bool player: if True, place the player "@" on a floor tile
+    :return: (kind, spawns), see compile_level
+    """
+    width = width or Game.max_tiles_x
+    height = height or Game.max_tiles_y
+    if width < 8 or height < 8:
+        raise ValueError("a generated level must be at least 8 x 8 tiles")
+    rng = np.random.default_rng(seed)
+    if style == "rooms":
+        floor = generate_rooms(rng, width, height)
+    elif style == "bsp":
+        floor = generate_bsp(rng, width, height)
+    elif style == "caves":
+        floor = generate_caves(rng, width, height)
+    else:
+        raise ValueError(f"style must be 'rooms', 'bsp' or 'caves', not {style!r}")
+    kind = np.where(floor, Floor.code, Wall.code).astype(np.uint8)
+    # ---- stairs, player, monsters and items on different floor tiles ----
+    cells = np.flatnonzero(floor)
+    monster_chars = [c for c, k in legend.items() if issubclass(k, Monster) and k is not Player]
+    item_chars = [c for c, k in legend.items() if issubclass(k, Item)]
+    number_monsters = rng.binomial(cells.size, monsters)
+    number_items = rng.binomial(cells.size, items)
+    chars = [ord("@")] * player
+    chars.extend(ord(c) for c in rng.choice(monster_chars, number_monsters))
+    chars.extend(ord(c) for c in rng.choice(item_chars, number_items))
+    chosen = rng.choice(cells, min(cells.size, len(chars) + 2), replace=False)
+    kind.flat[chosen[0]] = StairUp.code
+    kind.flat[chosen[1]] = StairDown.code
+    ys, xs = np.divmod(chosen[2:], width)
+    spawns = np.stack((chars[: len(ys)], xs, ys), axis=1).astype(np.int32).reshape(-1, 3)
+    spawns = spawns[np.lexsort((spawns[:, 1], spawns[:, 2]))]  # row by row, like compile_level
+    return kind, spawns
+
+
+def carve_corridor(floor, start, end, horizontal_first):
+    """carve an L-shaped corridor (1 tile wide) between the tiles start (x,y) and end (x,y) into floor"""
+    (x1, y1), (x2, y2) = start, end
+    corner = (x2, y1) if horizontal_first else (x1, y2)
+    floor[corner[1], min(x1, x2) : max(x1, x2) + 1] = True
+    floor[min(y1, y2) : max(y1, y2) + 1, corner[0]] = True
+
+
+def generate_rooms(rng, width, height, min_size=3, max_size=12):
+    """rooms and corridors: random rooms that do not touch other rooms,
+    each room is connected by a corridor to the room placed before.
+    returns bool numpy array [y, x], True for floor"""
+    floor = np.zeros((height, width), dtype=bool)
+    max_size = max(min_size + 1, min(max_size, width - 2, height - 2))
+    attempts = max(8, width * height // 40)
+    sizes = rng.integers(min_size, max_size, (attempts, 2))
+    corners = rng.random((attempts, 2))
+    bends = rng.random(attempts) < 0.5
+    previous = None
+    for (w, h), (fx, fy), bend in zip(sizes.tolist(), corners.tolist(), bends.tolist()):
+        x = 1 + int(fx * (width - w - 1))
+        y = 1 + int(fy * (height - h - 1))
+        if floor[y - 1 : y + h + 1, x - 1 : x + w + 1].any():
+            continue  # too close to another room or corridor
+        floor[y : y + h, x : x + w] = True
+        center = (x + w // 2, y + h // 2)
+        if previous is not None:
+            carve_corridor(floor, previous, center, bend)
+        previous = center
+    if previous is None:  # not a single room: one room in the middle
+        floor[height // 2 - 1 : height // 2 + 2, width // 2 - 1 : width // 2 + 2] = True
+    return floor
+
+
+def generate_bsp(rng, width, height, min_size=6):
+    """binary space partitioning: the level is split again and again (vertical or horizontal)
+    until the parts are smaller than 2 * min_size, then each part gets a room.
+    The rooms are connected in the order of the splits, so neighboring parts are connected.
+    returns bool numpy array [y, x], True for floor"""
+    floor = np.zeros((height, width), dtype=bool)
+    parts = [(1, 1, width - 2, height - 2)]  # x, y, width, height inside the border
+    previous = None
+    while parts:
+        x, y, w, h = parts.pop()
+        can_split_x, can_split_y = w >= 2 * min_size, h >= 2 * min_size
+        if can_split_x and (w >= h or not can_split_y):
+            split = int(rng.integers(min_size, w - min_size + 1))
+            parts.append((x + split, y, w - split, h))
+            parts.append((x, y, split, h))
+            continue
+        if can_split_y:
+            split = int(rng.integers(min_size, h - min_size + 1))
+            parts.append((x, y + split, w, h - split))
+            parts.append((x, y, w, split))
+            continue
+        # ---- leaf: a room with at least one tile of wall to the next part ----
+        rw = int(rng.integers(max(1, w // 2), w)) if w > 2 else 1
+        rh = int(rng.integers(max(1, h // 2), h)) if h > 2 else 1
+        rx = x + int(rng.integers(0, w - rw)) if w > rw else x
+        ry = y + int(rng.integers(0, h - rh)) if h > rh else y
+        floor[ry : ry + rh, rx : rx + rw] = True
+        center = (rx + rw // 2, ry + rh // 2)
+        if previous is not None:
+            carve_corridor(floor, previous, center, bool(rng.random() < 0.5))
+        previous = center
+    return floor
+
+
+def generate_caves(rng, width, height, fill=0.4, smoothing=2):
+    """caves: random walks (drunkard's walk) until about fill of the level is floor,
+    each walk starts on a random tile of the walks before. Then smoothing:
+    walls with 5 or more floor neighbors become floor.
+    Walks and smoothing only add floor to floor, so all floor tiles stay connected.
+    Levels bigger than about 1024 x 1024 tiles are walked at a coarser scale and then enlarged
+    (wider tunnels), so that the walks never cover more than about a million tiles.
+    returns bool numpy array [y, x], True for floor"""
+    scale = -(-int((width * height) ** 0.5) // 1024)
+    if scale > 1:
+        coarse = generate_caves(rng, width // scale, height // scale, fill, smoothing=0)
+        floor = np.zeros((height, width), dtype=bool)
+        enlarged = coarse.repeat(scale, axis=0).repeat(scale, axis=1)
+        floor[: enlarged.shape[0], : enlarged.shape[1]] = enlarged
+    else:
+        floor = np.zeros((height, width), dtype=bool)
+        length = max(100, int((width * height) ** 0.5))  # steps per walk
+        target = int(width * height * fill)
+        directions_x = np.array((0, 1, 0, -1), dtype=np.int32)
+        directions_y = np.array((-1, 0, 1, 0), dtype=np.int32)
+        xs = np.array([width // 2], dtype=np.int32)  # all tiles of the last batch of walks
+        ys = np.array([height // 2], dtype=np.int32)
+        floor[ys, xs] = True
+        done = 1
+        while done < target:
+            # a batch of walks, all starting on tiles of the last batch: floor that already exists
+            walks = min(1024, max(64, (target - done) // length))
+            starts = rng.integers(0, xs.size, walks)
+            steps = rng.integers(0, 4, (walks, length))
+            # clipping a walk never makes it jump: it stays on neighboring tiles
+            xs = np.clip(xs[starts, None] + np.cumsum(directions_x[steps], axis=1), 1, width - 2).ravel()
+            ys = np.clip(ys[starts, None] + np.cumsum(directions_y[steps], axis=1), 1, height - 2).ravel()
+            floor[ys, xs] = True
+            done = np.count_nonzero(floor)
+    for i in range(smoothing):
+        padded = np.pad(floor, 1)
+        neighbors = sum(
+            padded[1 + dy : height + 1 + dy, 1 + dx : width + 1 + dx].astype(np.uint8)
+            for dx, dy in zip(Game.neighbors_dx.tolist(), Game.neighbors_dy.tolist())
+        )
+        floor |= neighbors >= 5
+        floor[0, :] = floor[-1, :] = floor[:, 0] = floor[:, -1] = False
+    return floor
 
 
 # ----------------
@@ -3509,14 +5398,17 @@ def make_text(
     size=None,
     mono=False,
     alpha=None,
-    font=Viewer.font,
+    font=None,
     fontsize=None,
     colorkey=(0, 0, 0),
+    copy=False,
 ):
     """returns pygame surface (Viewer.gridsize[0] x Viewer.gridsize[1]) with text blitted on it.
     The text is centered on the surface. Font_size = Viewer.fontsize
     You still need to blit the surface.
     Use pygame.rect methods to get width and height of the new surface
+    Rendered surfaces are cached in Viewer.glyph_cache and shared between all callers:
+    do not draw on the returned surface or change its alpha/colorkey, use copy=True instead
 
     :param str text: the text to render into the surface
     :param (int, int, int) fgcolor: text color
@@ -3526,9 +5418,10 @@ def make_text(
     :param (int,int) size: size of Surface in pixel. If None, takes (Viewer.fontsize x Viewer.fontsize)
     :param bool mono: if True, use pygame.font.Font to render (better for non-proportional chars like wall-tiles)
     :param int alpha: alpha value for the whole Surface, if set to None the color (0,0,0) will be used as colorkey
-    :param font: font object. If mono, -> pygame.font.Font(fontobject. If not mono: pygame.freetype.Font(fontobject)
+    :param font: If mono: font file name (loaded once by Viewer.fonts), None for Viewer.monofontfilename. If not mono: pygame.freetype.Font object, None for Viewer.font
     :param int fontsize: size of font
     :param (int,int,int) colorkey: colorkey, can be set to None
+    :param bool copy: if True, returns a copy of the cached surface that can be changed by the caller
     :return: pygame.Surface
     """
     if size is None:
@@ -3537,6 +5430,22 @@ def make_text(
         size = (size, size)
     if fontsize is None:
         fontsize = Viewer.fontsize
+    key = (
+        text,
+        tuple(fgcolor),
+        None if bgcolor is None else tuple(bgcolor),
+        font,
+        fontsize,
+        mono,
+        style,
+        rotation,
+        alpha,
+        None if colorkey is None else tuple(colorkey),
+        tuple(Viewer.gridsize),
+    )
+    surf = Viewer.glyph_cache.get(key)
+    if surf is not None:
+        return surf.copy() if copy else surf
     surf = pygame.Surface(Viewer.gridsize)
 
     midx = Viewer.gridsize[0] // 2
@@ -3547,7 +5456,7 @@ def make_text(
             font = Viewer.monofontfilename
         # myfont = Viewer.monofontfilename
         # oldfont = pg.font.Font(os.path.join(fontdir, "..", "data", "fonts", "FreeMonoBold.otf"), fontsize)
-        myfont = pygame.font.Font(font, fontsize)
+        myfont = Viewer.fonts.get(font, fontsize, "font")
         # pic = oldfont.render(chars[char_index], True, (255, 64, 64))
         # rect = pic.get_rect()
         text1 = myfont.render(text, True, fgcolor)
@@ -3576,7 +5485,8 @@ def make_text(
         # else:
         surf.set_alpha(alpha)
     surf.convert_alpha()
-    return surf
+    Viewer.glyph_cache.put(key, surf)
+    return surf.copy() if copy else surf
 
 
 def throw_dice(dice=1, reroll=True, sides=6, correction=0):
@@ -3682,7 +5592,8 @@ def fight(a, b):
     text.append("Strike! {} attacks {}".format(type(a).__name__, type(b).__name__))
     damage = random.randint(1, 6)
     b.hp -= damage
-    impact_bubbles(a, b)
+    Game.noise(b.z, b.x, b.y, 10)  # fighting is loud
+    Game.present(impact_bubbles, a, b)
     b.is_attacked()
 
 
@@ -3755,10 +5666,28 @@ def write(
     :param font: font object
     :param str origin: can be one of those values: 'center', 'centercenter', 'topleft', 'topcenter', 'topright', 'centerleft', 'centerright',
     'bottomleft', 'bottomcenter', 'bottomright'
-    :param bool mono: DOES NOT WORK ! if True, use Viewer.monofont instead of Viewer.font
+    :param bool mono: if True, use the font Viewer.monofontfilename instead of Viewer.font
     :param int rotation: text rotation
     :param int style: text style, see pygame.freetype
+    :return: pygame.Rect of the blitted text
     """
+    surface = render_text(text, color, font_size, font, mono, rotation, style)
+    return blit_text(background, surface, x, y, origin)
+
+
+def render_text(
+    text,
+    color=(0, 0, 0),
+    font_size=None,
+    font=None,
+    mono=False,
+    rotation=0,
+    style=pygame.freetype.STYLE_STRONG,
+):
+    """renders text once and returns the Surface, see write for the parameters.
+    Surfaces are cached in Viewer.text_cache, so rendering the same text again is a
+    dictionary lookup. The returned Surface is shared: blit it (e.g. with blit_text)
+    as often as needed, but do not draw on it"""
     if font_size is None:
         font_size = 24
     #
@@ -3766,34 +5695,66 @@ def write(
         font = Viewer.font  # pygame.font.SysFont(font_name, font_size, bold)
 
     if mono:
-        font = Viewer.monofont
+        font = Viewer.fonts.get(Viewer.monofontfilename)
 
     # else:
     #    font = Viewer.font
-    surface, rrect = font.render(
-        text, color, rotation=rotation, size=font_size, style=style
-    )
-    width, height = rrect.width, rrect.height
-    # surface = font.render(text, True, color)
+    key = (text, tuple(color), font_size, font, style, rotation)
+    surface = Viewer.text_cache.get(key)
+    if surface is None:
+        surface, rrect = font.render(
+            text, color, rotation=rotation, size=font_size, style=style
+        )
+        # surface = font.render(text, True, color)
+        Viewer.text_cache.put(key, surface)
+    return surface
+
+
+def blit_text(background, surface, x=50, y=150, origin="topleft"):
+    """blit a Surface made by render_text on background, see write for x, y and origin
 
+    :return: pygame.Rect of the blitted text
+    """
+    width, height = surface.get_size()
     if origin == "center" or origin == "centercenter":
-        background.blit(surface, (x - width // 2, y - height // 2))
+        return background.blit(surface, (x - width // 2, y - height // 2))
     elif origin == "topleft":
-        background.blit(surface, (x, y))
+        return background.blit(surface, (x, y))
     elif origin == "topcenter":
-        background.blit(surface, (x - width // 2, y))
+        return background.blit(surface, (x - width // 2, y))
     elif origin == "topright":
-        background.blit(surface, (x - width, y))
+        return background.blit(surface, (x - width, y))
     elif origin == "centerleft":
-        background.blit(surface, (x, y - height // 2))
+        return background.blit(surface, (x, y - height // 2))
     elif origin == "centerright":
-        background.blit(surface, (x - width, y - height // 2))
+        return background.blit(surface, (x - width, y - height // 2))
     elif origin == "bottomleft":
-        background.blit(surface, (x, y - height))
+        return background.blit(surface, (x, y - height))
     elif origin == "bottomcenter":
-        background.blit(surface, (x - width // 2, y))
+        return background.blit(surface, (x - width // 2, y))
     elif origin == "bottomright":
-        background.blit(surface, (x - width, y - height))
+        return background.blit(surface, (x - width, y - height))
+
+
+def simulate(turns=1000, seed=None):
+    """play the game headless (without display, fonts or mixer): the player walks at random.
+    useful for balancing and regression runs, e.g. on a server without display
+
+    :param int turns: maximum number of turns. The simulation stops earlier when the player dies
+    :param seed: seed for the random module, for reproducible runs
+    :return: (int turns played, float turns per second)
+    """
+    if seed is not None:
+        random.seed(seed)
+    g = Game(headless=True)
+    start = time.perf_counter()
+    played = 0
+    while played < turns and Game.running:
+        dx, dy = random.choice(((0, -1), (1, 0), (0, 1), (-1, 0), (0, 0)))
+        g.turn(dx, dy)
+        played += 1
+    seconds = time.perf_counter() - start
+    return played, played / seconds if seconds > 0 else 0
 
 
 ## -------------- code at module level -----------------------------
@@ -3860,6 +5821,12 @@ level3 = """
 ################################"""
 
 if __name__ == "__main__":
+    if "--headless" in sys.argv:
+        # python pipe_rogue.py --headless [turns] [seed]
+        arguments = sys.argv[sys.argv.index("--headless") + 1 :]
+        played, speed = simulate(*[int(a) for a in arguments[:2]])
+        print(f"{played} turns played headless, {speed:.1f} turns per second")
+        sys.exit()
     # g = Game()
     Viewer(
         width=1200,